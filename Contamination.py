@@ -1,9 +1,13 @@
 import numpy as np
-import mpmath as mp
-import scipy.integrate as integrate
+import os
+import json
+import hashlib
+from functools import partial
+import scipy.special as special
+import scipy.interpolate as interpolate
 from astropy import units as u
 
-def cont_prob(flux, wavelength, separation, survey = None):
+def cont_prob(flux, wavelength, separation, survey = None, cache_dir=None):
     
     """
     
@@ -16,18 +20,20 @@ def cont_prob(flux, wavelength, separation, survey = None):
         
     flux:                Limiting detection flux in astropy units of choice or mJy if left unitless.
     
-    wavelength:          Wavelength of observation in mm, only accepts 1.1 or 1.3 or 0.87.
+    wavelength:          Wavelength of observation in mm, only accepts 1.1 or 1.3 or 0.87, or the name of a model added with register_counts.
     
     separation:          Minimum separation between centre of image and contaminating galaxy in astropy unit of choice or arcsec if left blank.
     
     survey:              Number of stars in your survey
     
+    cache_dir:           Directory the number count table is saved to and loaded from, see counts_table.
+    
     --------------------------------------------------------------------------------------------------------
     
     """
     
-    if wavelength != 1.1 and  wavelength != 1.3 and wavelength != 0.87:
-        raise ValueError('Wavelength must be 1.3, 1.1 or 0.87')
+    if wavelength not in COUNT_MODELS:
+        raise ValueError('Wavelength must be 1.3, 1.1 or 0.87, or a model added with register_counts')
         
     if type(flux*u.millijansky) == type(u.millijansky*u.millijansky):# avoids Unit != IrreducibleUnit != PrefixUnit by comparing for composite units
         S = flux.to(u.millijansky).value
@@ -39,31 +45,8 @@ def cont_prob(flux, wavelength, separation, survey = None):
     else:
         area = np.pi*(separation*u.arcsec.to(u.degree))**2 
         
-    if wavelength == 1.1 or wavelength == 1.3: #using Schechter function from Carniani et al. 2015. A&A. 584. A78
-        if wavelength == 1.3:
-            #Ideally should be used above 0.06 mJy.
-            phi = 1.8e3 #per square degree
-            S0 = 1.7 #mJy
-            a = -2.08
-        elif wavelength == 1.1:
-            #Ideally should be used above 0.1 mJy.
-            phi = 2.7e3
-            S0 = 2.6
-            a = -1.81        
-        
-        siglim = S/S0
-        
-        N = phi*(mp.gammainc(a+1,a=siglim,b='inf')) # integrating the Schechter function gives the incomplete gamma function scaled by phi
-        lam = N*area #average number of galaxies in your area of interest
-    if wavelength == 0.87: #using double power law from Stach et al. 2018. ApJ. 860. 161.
-        #Ideally should be used between 2 and 8 mJy.
-        N0 = 1200 #per square degree
-        S0 = 5.1 #mJy
-        siglim = S/S0
-        a = 5.9
-        b = 0.4
-        N = integrate.quad(lambda sig: (N0)*((sig**a + sig**b)**-1), siglim, +np.inf)
-        lam = N[0]*area #average number of galaxies in your area of interest
+    N = cached_counts(S, wavelength, cache_dir) # N(>S) per square degree, see number_counts
+    lam = N*area #average number of galaxies in your area of interest
     
     prob0 = (np.e**(-1*lam)) #probability of no galaxies, poisson distribution
     prob = 1 - prob0 #probability of at least one galaxy contaminating a source
@@ -87,3 +70,435 @@ def cont_prob(flux, wavelength, separation, survey = None):
         print('Expected number of such galaxies in THIS image is {}'.format(lam))
         print(' ')
         return float(prob)
+
+#Schechter function parameters of Carniani et al. 2015. A&A. 584. A78 (phi per square degree, S0 in mJy, a).
+#1.3 mm should ideally be used above 0.06 mJy, 1.1 mm above 0.1 mJy.
+SCHECHTER = {1.3: (1.8e3, 1.7, -2.08), 1.1: (2.7e3, 2.6, -1.81)}
+#Double power law parameters of Stach et al. 2018. ApJ. 860. 161 (N0 per square degree, S0 in mJy, a, b).
+#Ideally should be used between 2 and 8 mJy.
+DOUBLE_POWER_LAW = {0.87: (1200, 5.1, 5.9, 0.4)}
+
+def _upper_gamma(s, x, terms=60):
+    
+    #vectorised upper incomplete gamma function for any real s, x > 0, to ~1e-12 relative accuracy
+    x = np.asarray(x, dtype=float)
+    result = np.empty_like(x)
+    small = x < 1
+    
+    #for small x recur down from gammaincc at positive s, Gamma(s,x) = (Gamma(s+1,x) - x**s*exp(-x))/s
+    xs = x[small]
+    k = int(np.floor(-s)) + 1 if s <= 0 else 0
+    g = special.gammaincc(s + k, xs)*special.gamma(s + k)
+    for j in range(k - 1, -1, -1):
+        g = (g - xs**(s + j)*np.exp(-xs))/(s + j)
+    result[small] = g
+    
+    #for large x, where the recurrence cancels, use the continued fraction (modified Lentz)
+    xl = x[~small]
+    b = xl + 1 - s
+    c = np.full_like(xl, 1e300)
+    d = 1/b
+    h = d
+    for i in range(1, terms):
+        an = -i*(i - s)
+        b = b + 2
+        d = an*d + b
+        d = np.where(np.abs(d) < 1e-300, 1e-300, d)
+        c = b + an/c
+        c = np.where(np.abs(c) < 1e-300, 1e-300, c)
+        d = 1/d
+        h = h*d*c
+    result[~small] = np.exp(-xl + s*np.log(xl))*h
+    return result
+
+def _double_power_law_tail(x, a, b):
+    
+    #integral of 1/(sig**a + sig**b) from x to infinity, in closed form with the hypergeometric function
+    x = np.asarray(x, dtype=float)
+    c = a - b
+    result = np.empty_like(x)
+    small = x < 1
+    #below 1 subtract the integral from 0 to x from the total
+    xs = x[small]
+    total = np.pi/c/np.sin(np.pi*(1 - b)/c)
+    result[small] = total - xs**(1 - b)/(1 - b)*special.hyp2f1(1, (1 - b)/c, 1 + (1 - b)/c, -xs**c)
+    #above 1 substitute t = 1/sig, giving the integral of t**(a-2)/(1 + t**c) from 0 to 1/x
+    y = 1/x[~small]
+    result[~small] = y**(a - 1)/(a - 1)*special.hyp2f1(1, (a - 1)/c, 1 + (a - 1)/c, -y**c)
+    return result
+
+def number_counts(flux, wavelength):
+    
+    """
+    
+    Cumulative number counts N(>S) per square degree at the wavelengths supported by cont_prob, vectorised over flux.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    flux:                Flux/es S in astropy units of choice or mJy if left unitless.
+    
+    wavelength:          Wavelength of observation in mm, only accepts 1.1 or 1.3 or 0.87.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    if isinstance(flux, u.Quantity):
+        flux = flux.to(u.millijansky).value
+    flux = np.asarray(flux, dtype=float)
+    if wavelength in SCHECHTER:
+        phi, S0, a = SCHECHTER[wavelength]
+        return phi*_upper_gamma(a + 1, flux/S0) # integrating the Schechter function gives the incomplete gamma function scaled by phi
+    elif wavelength in DOUBLE_POWER_LAW:
+        N0, S0, a, b = DOUBLE_POWER_LAW[wavelength]
+        return N0*_double_power_law_tail(flux/S0, a, b)
+    raise ValueError('Wavelength must be 1.3, 1.1 or 0.87')
+
+def cont_prob_array(flux, wavelength, separation, survey=None, cache_dir=None):
+    
+    """
+    
+    Vectorised cont_prob, without printing.
+    flux, separation and survey may be arrays, which are broadcast against each other, e.g. flux[:, None, None], separation[None, :, None] and survey[None, None, :]
+    for a grid of probabilities over all three.
+    Returns the probability of at least one contaminating galaxy in an image or, if survey is given, [probability, expected number of contaminated images].
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    flux, wavelength, separation, survey, cache_dir: as for cont_prob, N(>S) is taken from cached_counts.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    if isinstance(separation, u.Quantity):
+        separation = separation.to(u.degree).value
+    else:
+        separation = np.asarray(separation, dtype=float)*u.arcsec.to(u.degree)
+    area = np.pi*separation**2
+    
+    lam = cached_counts(flux, wavelength, cache_dir)*area #average number of galaxies in your area of interest
+    prob = -np.expm1(-lam) #probability of at least one galaxy, poisson distribution
+    
+    if survey is not None:
+        return [prob, prob*np.asarray(survey)]
+    return prob
+
+"""
+Cached number counts.
+
+Each model in COUNT_MODELS has N(>S) tabulated on a dense log-flux grid the first time it is used, kept in memory and optionally saved to disk,
+in the cache_dir passed to the functions below or, if that is None, in CACHE_DIR (None by default, i.e. no disk cache).
+Queries are then served by monotone (PCHIP) interpolation of log N against log S, whose maximum relative error,
+measured against the model halfway between grid points when the table is built, is given by counts_table(name)['error'].
+Fluxes outside the tabulated range are evaluated with the model directly.
+New models, e.g. other wavelengths or papers, are added with register_counts and get the same caching.
+"""
+
+COUNT_MODELS = {}
+_count_tables = {}
+_count_saved = set() #(name, cache_dir) pairs whose table is known to be on disk
+CACHE_DIR = None
+
+def register_counts(name, function, smin=0.01, smax=100, npts=2000, params=None):
+    
+    """
+    
+    Adds a number count model for use by cont_prob, cont_prob_array and cached_counts.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    name:       Key the model is used by, e.g. a wavelength in mm.
+    
+    function:   Function returning N(>S) per square degree for an array of fluxes S in mJy.
+    
+    smin, smax: Range of fluxes, in mJy, to tabulate.
+    
+    npts:       Number of logarithmically spaced fluxes tabulated.
+    
+    params:     JSON serialisable model parameters, any change gives a new disk cache file.
+                The disk cache is keyed on name, the flux grid and params only, so if 'function' is changed for the same name
+                change params too (or delete the cached file), else the stale table is loaded from disk.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    COUNT_MODELS[name] = {'function': function, 'smin': smin, 'smax': smax, 'npts': npts, 'params': params}
+    _count_tables.pop(name, None)
+    _count_saved.difference_update({key for key in _count_saved if key[0] == name})
+
+for _wavelength in SCHECHTER:
+    register_counts(_wavelength, partial(number_counts, wavelength=_wavelength), params=SCHECHTER[_wavelength])
+for _wavelength in DOUBLE_POWER_LAW:
+    register_counts(_wavelength, partial(number_counts, wavelength=_wavelength), params=DOUBLE_POWER_LAW[_wavelength])
+
+def _counts_path(name, cache_dir):
+    model = COUNT_MODELS[name]
+    key = json.dumps([repr(name), model['smin'], model['smax'], model['npts'], model['params']], sort_keys=True)
+    return os.path.join(cache_dir, 'counts_{}.npz'.format(hashlib.sha1(key.encode()).hexdigest()[:16]))
+
+def counts_table(name, cache_dir=None):
+    
+    """
+    
+    Returns the table for number count model 'name', a dictionary of 'logS', 'logN', 'interpolator' and 'error', building it if needed.
+    If cache_dir (or, if that is None, CACHE_DIR) is given the table is also saved to, and on later runs loaded from, that directory,
+    including when the table was already built in memory without one.
+    
+    """
+    
+    if name not in COUNT_MODELS:
+        raise ValueError('No number count model {!r}, see register_counts'.format(name))
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    if name in _count_tables and (cache_dir is None or (name, cache_dir) in _count_saved):
+        return _count_tables[name]
+    model = COUNT_MODELS[name]
+    path = None if cache_dir is None else _counts_path(name, cache_dir)
+    
+    if name in _count_tables:
+        table = _count_tables[name]
+        logS, logN, error = table['logS'], table['logN'], table['error']
+    elif path is not None and os.path.exists(path):
+        with np.load(path) as file:
+            logS, logN, error = file['logS'], file['logN'], float(file['error'])
+    else:
+        logS = np.linspace(np.log10(model['smin']), np.log10(model['smax']), model['npts'])
+        logN = np.log10(model['function'](10**logS))
+        mid = (logS[1:] + logS[:-1])/2
+        error = np.max(np.abs(10**(interpolate.PchipInterpolator(logS, logN)(mid) - np.log10(model['function'](10**mid))) - 1))
+    
+    if path is not None:
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = '{}.{}.tmp.npz'.format(path, os.getpid())
+            np.savez(tmp, logS=logS, logN=logN, error=error)
+            os.replace(tmp, path)
+        _count_saved.add((name, cache_dir))
+    
+    if name not in _count_tables:
+        _count_tables[name] = {'logS': logS, 'logN': logN, 'interpolator': interpolate.PchipInterpolator(logS, logN), 'error': error}
+    return _count_tables[name]
+
+def cached_counts(flux, name, cache_dir=None):
+    
+    """
+    
+    N(>S) per square degree for number count model 'name' (e.g. a wavelength in mm), interpolated from its cached table, see counts_table.
+    flux in astropy units of choice or mJy if left unitless, may be an array.
+    
+    """
+    
+    if isinstance(flux, u.Quantity):
+        flux = flux.to(u.millijansky).value
+    flux = np.asarray(flux, dtype=float)
+    table = counts_table(name, cache_dir)
+    logS = np.log10(flux)
+    inside = (logS >= table['logS'][0]) & (logS <= table['logS'][-1])
+    if np.all(inside):
+        return 10**table['interpolator'](logS)
+    N = np.empty_like(flux)
+    N[inside] = 10**table['interpolator'](logS[inside])
+    N[~inside] = COUNT_MODELS[name]['function'](flux[~inside])
+    return N
+
+def _inversion_grid(name, flux, cache_dir=None, per_dex=100, extra=6):
+    
+    #log N(>S) against log S for drawing fluxes, the cached table extended with the model itself down to the lowest flux limit
+    #and to 'extra' decades above the highest, so every limit lies on the grid and N(>S) can be inverted above it
+    table = counts_table(name, cache_dir)
+    function = COUNT_MODELS[name]['function']
+    logS, logN = table['logS'], table['logN']
+    low, high = np.log10(flux.min()), max(logS[-1], np.log10(flux.max())) + extra
+    below = np.linspace(low, logS[0], max(2, int(np.ceil((logS[0] - low)*per_dex)) + 1))[:-1] if low < logS[0] else np.empty(0)
+    above = np.linspace(logS[-1], high, max(2, int(np.ceil((high - logS[-1])*per_dex)) + 1))[1:]
+    with np.errstate(divide='ignore'):
+        logS = np.concatenate([below, logS, above])
+        logN = np.concatenate([np.log10(function(10**below)), logN, np.log10(function(10**above))])
+    keep = np.isfinite(logN) #counts that underflow to 0 give no galaxies to draw
+    return logS[keep], logN[keep]
+
+def _simulate_batch(seed, nreal, lam, flux, logS, logN, flux_bins, radius_bins):
+    
+    #summary statistics of a batch of nreal realisations
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(lam, size=(nreal, len(lam)))
+    contaminated = counts > 0
+    ncontaminated = np.bincount(contaminated.sum(axis=1), minlength=len(lam) + 1)
+    pointing = contaminated.sum(axis=0)
+    
+    #every galaxy drawn gets a flux above its pointing's limit, by inverting N(>S), and a position uniform in the circle
+    total = counts.sum()
+    limits = np.repeat(np.tile(np.interp(np.log10(flux), logS, logN), nreal), counts.ravel())
+    logflux = np.interp(limits + np.log10(1 - rng.random(total)), logN[::-1], logS[::-1])
+    flux_hist = np.histogram(10**logflux, flux_bins)[0]
+    radius_hist = np.histogram(np.sqrt(rng.random(total)), radius_bins)[0]
+    return ncontaminated, pointing, flux_hist, radius_hist
+
+def simulate_contamination(flux, wavelength, separation, nreal=1000, seed=None, processes=1, batch=100, flux_bins=None, radius_bins=20, cache_dir=None):
+    
+    """
+    
+    Monte Carlo simulation of background galaxy contamination across a survey whose pointings have different depths and radii.
+    Each realisation draws the number of galaxies in every pointing (Poisson, from the cached number counts, see cached_counts),
+    their fluxes above the pointing's flux limit and their positions uniformly within the pointing's radius.
+    Batches of realisations are run on 'processes' worker processes with independent random streams spawned from 'seed',
+    and only summary statistics are accumulated, so memory use does not grow with nreal.
+    
+    Returns a dictionary of:
+    'expected'              expected number of contaminating galaxies in each pointing,
+    'pointing_probability'  fraction of realisations in which each pointing was contaminated,
+    'ncontaminated_hist'    number of realisations with 0, 1, 2, ... contaminated pointings,
+    'ncontaminated_mean', 'ncontaminated_std' and 'ncontaminated_percentiles' (16th, 50th and 84th) of the number of contaminated pointings,
+    'flux_bins', 'flux_hist'       histogram of contaminating galaxy fluxes in mJy,
+    'radius_bins', 'radius_hist'   histogram of contaminating galaxy separations as a fraction of their pointing's radius.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    flux:         Limiting detection flux of each pointing, array in astropy units of choice or mJy if left unitless.
+    
+    wavelength:   Number count model, as for cont_prob.
+    
+    separation:   Radius of each pointing, array in astropy units of choice or arcsec if left unitless.
+    
+    nreal:        Number of realisations of the survey.
+    
+    seed:         Seed for numpy.random.SeedSequence, for reproducible results (independent of the number of processes).
+    
+    processes:    Number of worker processes.
+    
+    batch:        Number of realisations drawn at once, each batch has its own random stream.
+    
+    flux_bins:    Bin edges of the flux histogram in mJy, 50 logarithmic bins from the lowest flux limit to the top of the cached table (or 10 times the highest limit) by default.
+    
+    radius_bins:  Number of bins of the fractional separation histogram.
+    
+    cache_dir:    Directory the number count table is saved to and loaded from, see counts_table.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    if isinstance(flux, u.Quantity):
+        flux = flux.to(u.millijansky).value
+    if isinstance(separation, u.Quantity):
+        separation = separation.to(u.degree).value
+    else:
+        separation = np.asarray(separation, dtype=float)*u.arcsec.to(u.degree)
+    flux, separation = np.broadcast_arrays(np.atleast_1d(np.asarray(flux, dtype=float)), separation)
+    
+    table = counts_table(wavelength, cache_dir)
+    lam = cached_counts(flux, wavelength, cache_dir)*np.pi*separation**2
+    logS, logN = _inversion_grid(wavelength, flux, cache_dir)
+    if flux_bins is None:
+        flux_bins = np.geomspace(flux.min(), max(10**table['logS'][-1], 10*flux.max()), 51)
+    radius_bins = np.linspace(0, 1, radius_bins + 1)
+    
+    #each batch of realisations has its own random stream, so results do not depend on the number of processes
+    sizes = [min(batch, nreal - start) for start in range(0, nreal, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = (seeds, sizes) + tuple([value]*len(sizes) for value in (lam, flux, logS, logN, flux_bins, radius_bins))
+    
+    ncontaminated = np.zeros(len(lam) + 1, dtype=np.int64)
+    pointing = np.zeros(len(lam), dtype=np.int64)
+    flux_hist = np.zeros(len(flux_bins) - 1, dtype=np.int64)
+    radius_hist = np.zeros(len(radius_bins) - 1, dtype=np.int64)
+    def accumulate(results):
+        for result in results:
+            for total, part in zip((ncontaminated, pointing, flux_hist, radius_hist), result):
+                total += part
+    if processes == 1:
+        accumulate(map(_simulate_batch, *args))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            accumulate(pool.map(_simulate_batch, *args, chunksize=max(1, len(sizes)//(4*processes))))
+    
+    n = np.arange(len(ncontaminated))
+    mean = np.sum(n*ncontaminated)/nreal
+    cumulative = np.cumsum(ncontaminated)/nreal
+    return {'expected': lam,
+            'pointing_probability': pointing/nreal,
+            'ncontaminated_hist': ncontaminated,
+            'ncontaminated_mean': mean,
+            'ncontaminated_std': np.sqrt(np.sum((n - mean)**2*ncontaminated)/nreal),
+            'ncontaminated_percentiles': n[np.searchsorted(cumulative, [0.16, 0.5, 0.84])],
+            'flux_bins': flux_bins, 'flux_hist': flux_hist,
+            'radius_bins': radius_bins, 'radius_hist': radius_hist}
+
+def cont_prob_beam(flux, wavelength, separation, fwhm=None, radii=None, response=None, nannuli=200, survey=None, cache_dir=None):
+    
+    """
+    
+    cont_prob_array for pointings whose sensitivity falls with radius, e.g. an interferometer's primary beam.
+    The flux limit at radius r is flux/response(r), and the expected number of galaxies is the sum of N(>flux/response(r))
+    over 'nannuli' annuli out to 'separation', all evaluated in one array with the cached number counts, see cached_counts.
+    Give either the FWHM of a Gaussian beam or a sampled response profile.
+    Returns the probability of at least one contaminating galaxy in an image or, if survey is given, [probability, expected number of contaminated images].
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    flux:         Limiting detection flux at the centre of the pointing in astropy units of choice or mJy if left unitless, may be an array.
+    
+    wavelength:   Number count model, as for cont_prob.
+    
+    separation:   Outer radius within which contaminating galaxies are counted, in astropy units of choice or arcsec if left unitless, may be an array.
+    
+    fwhm:         Full width at half maximum of a Gaussian primary beam, in astropy units of choice or arcsec if left unitless.
+    
+    radii:        Radii at which the response is sampled, in astropy units of choice or arcsec if left unitless, increasing.
+    
+    response:     Sensitivity relative to the centre at each of 'radii', linearly interpolated between them.
+    
+    nannuli:      Number of annuli integrated over.
+    
+    survey:       Number of stars in your survey, as for cont_prob, may be an array.
+    
+    cache_dir:    Directory the number count table is saved to and loaded from, see counts_table.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    def arcsec(value):
+        if isinstance(value, u.Quantity):
+            return value.to(u.arcsec).value
+        return np.asarray(value, dtype=float)
+    
+    if (fwhm is None) == (radii is None or response is None):
+        raise ValueError('Please specify either fwhm or both radii and response')
+    if isinstance(flux, u.Quantity):
+        flux = flux.to(u.millijansky).value
+    flux = np.asarray(flux, dtype=float)[..., None]
+    separation = arcsec(separation)[..., None]
+    
+    #annuli of equal width in radius, evaluated at their mid radius
+    edges = np.linspace(0, 1, nannuli + 1)
+    r = separation*(edges[1:] + edges[:-1])/2
+    area = np.pi*(separation*u.arcsec.to(u.degree))**2*(edges[1:]**2 - edges[:-1]**2)
+    
+    if fwhm is not None:
+        beam = np.exp(-4*np.log(2)*(r/arcsec(fwhm))**2)
+    else:
+        beam = np.interp(r, arcsec(radii), np.asarray(response, dtype=float))
+    
+    with np.errstate(divide='ignore'):
+        limit = flux/beam
+    N = np.where(beam > 0, cached_counts(np.where(beam > 0, limit, 1), wavelength, cache_dir), 0) #no sensitivity, no detections
+    lam = np.sum(N*area, axis=-1) #average number of galaxies in your area of interest
+    prob = -np.expm1(-lam)
+    
+    if survey is not None:
+        return [prob, prob*np.asarray(survey)]
+    return prob
@@ -0,0 +1,118 @@
+import numpy as np
+import Rotation as rot
+
+"""
+
+These functions sample elliptical (Keplerian) orbits in the model frame used by Rotation.py, for many bodies and epochs at once.
+
+The orbit lies in the model x-y plane with pericentre along +x and motion anticlockwise about +z, so that the
+'anom' (argument of pericentre), 'inc' and 'pos' arguments of Rotation.py orient it on the sky.
+
+Body parameters (a, e, period, tperi, and orientations) may be scalars or (B,) arrays for B bodies.
+Epochs/mean anomalies may be (T,) arrays shared by every body or (B,T) arrays, results then have shape (B,T,3) (or (T,3) for a single body).
+
+"""
+
+def solve_kepler(M, e, tol=1e-12, maxiter=50):
+
+    """
+
+    Solves Kepler's equation M = E - e*sin(E) for the eccentric anomaly E (radians) with Halley's method.
+    M and e are broadcast against each other, only elements that have not yet converged to within 'tol' are iterated.
+    Raises a RuntimeError if any element has not converged after 'maxiter' iterations.
+
+    """
+
+    M, e = np.broadcast_arrays(np.asarray(M, dtype=float), np.asarray(e, dtype=float))
+    if np.any((e < 0) | (e >= 1)):
+        raise ValueError('Eccentricities must satisfy 0 <= e < 1')
+
+    wrapped = np.remainder(M + np.pi, 2*np.pi) - np.pi # wrap to [-pi, pi) for a good starting guess
+    turns, M = M - wrapped, wrapped
+    E = M + 0.85*e*np.sign(np.sin(M))
+    E = np.where(e < 0.8, M + e*np.sin(M), E)
+
+    todo = np.arange(E.size)
+    Ef, Mf, ef = E.ravel(), M.ravel(), e.ravel()
+    for _ in range(maxiter):
+        Et, Mt, et = Ef[todo], Mf[todo], ef[todo]
+        esinE = et*np.sin(Et)
+        ecosE = et*np.cos(Et)
+        f0 = Et - esinE - Mt
+        f1 = 1 - ecosE
+        f2 = esinE
+        dE = -f0/(f1 - 0.5*f0*f2/f1)
+        Ef[todo] = Et + dE
+        todo = todo[np.abs(dE) > tol]
+        if todo.size == 0:
+            break
+    else:
+        raise RuntimeError('Kepler solver did not converge for {} elements within {} iterations'.format(todo.size, maxiter))
+
+    return Ef.reshape(E.shape) + turns # add back the whole orbits removed from M
+
+def _body_axis(value):
+    # per-body (B,) parameters get a trailing axis to broadcast against (T,) or (B,T) anomalies
+    value = np.asarray(value, dtype=float)
+    return value[..., None] if value.ndim else value
+
+def mean_anomaly(epochs, period, tperi=0):
+
+    """Mean anomaly (radians) at 'epochs' for orbital period 'period' and time of pericentre 'tperi', in any consistent time units."""
+
+    return 2*np.pi*(np.asarray(epochs, dtype=float) - _body_axis(tperi))/_body_axis(period)
+
+def orbit_positions(a, e, mean_anom=None, epochs=None, period=None, tperi=0, tol=1e-12):
+
+    """
+
+    Model frame cartesian positions of bodies on elliptical orbits.
+
+    ---------------------------------------------------------------------------------------------------------
+
+    Parameters:
+
+    a:          Semi-major axis/axes, positions are returned in the same units.
+
+    e:          Eccentricity/eccentricities.
+
+    mean_anom:  Mean anomalies in radians, either this OR epochs and period should be given.
+
+    epochs:     Times at which to sample the orbits, in the same units as period and tperi.
+
+    period:     Orbital period/s.
+
+    tperi:      Time/s of pericentre passage.
+
+    tol:        Convergence tolerance of the Kepler solver in radians of eccentric anomaly.
+
+    --------------------------------------------------------------------------------------------------------
+
+    """
+
+    if mean_anom is None:
+        if epochs is None or period is None:
+            raise ValueError('Please specify either mean_anom or both epochs and period')
+        mean_anom = mean_anomaly(epochs, period, tperi)
+    a = _body_axis(a)
+    e = _body_axis(e)
+
+    E = solve_kepler(mean_anom, e, tol=tol)
+    x = a*(np.cos(E) - e)
+    y = a*np.sqrt(1 - e**2)*np.sin(E)
+    x, y = np.broadcast_arrays(x, y)
+    return np.stack([x, y, np.zeros_like(x)], axis=-1)
+
+def orbit_sky_positions(a, e, mean_anom=None, epochs=None, period=None, tperi=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, convention='standard', tol=1e-12):
+
+    """
+
+    Image frame cartesian positions of bodies on elliptical orbits, i.e. 'orbit_positions' derotated with Rotation.py.
+    inc, pos, anom and the offsets may differ per body, see 'orbit_positions' and Rotation.py for the arguments.
+
+    """
+
+    model = orbit_positions(a, e, mean_anom, epochs, period, tperi, tol)
+    P321 = rot.rotation_matrices(inc, pos, anom, DEG, convention)
+    offsets = np.stack(np.broadcast_arrays(*(np.asarray(o, dtype=float) for o in (X0, Y0, Z0))), axis=-1)
+    return np.matmul(model, np.swapaxes(P321, -1, -2)) + offsets[..., None, :]
@@ -1,4 +1,7 @@
+import os
 import numpy as np
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 """
 
@@ -29,8 +32,15 @@ Y0      : Y coordinate offset of external frame relative to rotated model frame
 Z0      : Z coordinate offset of external frame relative to rotated model frame
 DEG     : if left as 0 angular inputs are interpreted as in radians, otherwise (e.g. DEG = 1) inputs are interpreted as in degrees.
 
+Any of the point arguments may be given as equally shaped numpy arrays (e.g. (N,) arrays of R, AZ, EL) in which case arrays are returned.
+For (N,3) arrays of points see 'rotate_points' and 'derotate_points' below.
+
 """
 
+def _nonzero(*args):
+    # array safe version of 'a or b or c', used to pick between spherical and cartesian inputs
+    return any(np.any(arg) for arg in args)
+
 def exp_rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0):
 
     if DEG:
@@ -39,12 +49,12 @@ def exp_rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0,
         anom= np.deg2rad(anom)
         AZ = np.deg2rad(AZ)
         EL = np.deg2rad(EL)     
-    if R or AZ or EL:
+    if _nonzero(R, AZ, EL):
         THE = np.pi/2 -  EL
         X = R*np.cos(AZ)*np.sin(THE) - X0
         Y = R*np.sin(AZ)*np.sin(THE) - Y0
         Z = R*np.cos(THE)             - Z0
-    elif X or Y or Z:
+    elif _nonzero(X, Y, Z):
         X = X - X0
         Y = Y - Y0
         Z = Z - Z0
@@ -69,9 +79,9 @@ def exp_rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0,
     if DEG:
         az = np.rad2deg(az)
         el = np.rad2deg(el)
-    if R or AZ or EL:
+    if _nonzero(R, AZ, EL):
         return [r,az,el]          
-    elif X or Y or Z:
+    elif _nonzero(X, Y, Z):
         return [x,y,z]
     
 def rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0):
@@ -81,17 +91,17 @@ def rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=
         anom= np.deg2rad(anom)
         AZ = np.deg2rad(AZ)
         EL = np.deg2rad(EL)     
-    if R or AZ or EL:
+    if _nonzero(R, AZ, EL):
         THE = np.pi/2 -  EL
         X = R*np.cos(AZ)*np.sin(THE) - X0
         Y = R*np.sin(AZ)*np.sin(THE) - Y0
         Z = R*np.cos(THE)             - Z0
-    elif X or Y or Z:
+    elif _nonzero(X, Y, Z):
         X = X - X0
         Y = Y - Y0
         Z = Z - Z0
         
-    IMPLANE = np.array([[X],[Y],[Z]])
+    IMPLANE = np.array(np.broadcast_arrays(X, Y, Z))
 
     P3pos = np.array([[np.cos(pos),-np.sin(pos),0],
                       [np.sin(pos), np.cos(pos),0],
@@ -103,11 +113,11 @@ def rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=
                        [np.sin(anom), np.cos(anom),0],
                        [     0      ,      0      ,1]])
     P321 = np.matmul(P3pos,np.matmul(P2inc,P1ano))
-    MODPLANE = np.matmul(np.transpose(P321),IMPLANE) 
+    MODPLANE = np.tensordot(np.transpose(P321), IMPLANE, axes=1) 
 
-    x = MODPLANE[0][0]
-    y = MODPLANE[1][0]
-    z = MODPLANE[2][0]
+    x = MODPLANE[0]
+    y = MODPLANE[1]
+    z = MODPLANE[2]
     
     rxy2 = x**2 + y**2
     rxy = np.sqrt(rxy2)
@@ -118,9 +128,9 @@ def rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=
     if DEG:
         az = np.rad2deg(az)
         el = np.rad2deg(el)
-    if R or AZ or EL:
+    if _nonzero(R, AZ, EL):
         return [r,az,el]          
-    elif X or Y or Z:
+    elif _nonzero(X, Y, Z):
         return [x,y,z]
   
 def exp_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0):
@@ -130,12 +140,12 @@ def exp_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=
         anom= np.deg2rad(anom)
         az = np.deg2rad(az)
         el = np.deg2rad(el)     
-    if r or az or el:
+    if _nonzero(r, az, el):
         the = np.pi/2 -  el
         x = r*np.cos(az)*np.sin(the)
         y = r*np.sin(az)*np.sin(the)
         z = r*np.cos(the)            
-    elif x or y or z:
+    elif _nonzero(x, y, z):
         x = x
         y = y
         z = z  
@@ -160,9 +170,9 @@ def exp_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=
     if DEG:
         AZ = np.rad2deg(AZ)
         EL = np.rad2deg(EL)
-    if r or az or el:
+    if _nonzero(r, az, el):
         return [R,AZ,EL]          
-    elif x or y or z:
+    elif _nonzero(x, y, z):
         return [X,Y,Z]
     
 
@@ -173,17 +183,17 @@ def derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z
         anom= np.deg2rad(anom)
         az = np.deg2rad(az)
         el = np.deg2rad(el)     
-    if r or az or el:
+    if _nonzero(r, az, el):
         the = np.pi/2 -  el
         x = r*np.cos(az)*np.sin(the)
         y = r*np.sin(az)*np.sin(the)
         z = r*np.cos(the)             
-    elif x or y or z:
+    elif _nonzero(x, y, z):
         x = x
         y = y
         z = z
         
-    IMPLANE = np.array([[x],[y],[z]])
+    IMPLANE = np.array(np.broadcast_arrays(x, y, z))
 
     P3pos = np.array([ [np.cos(pos),-np.sin(pos),0],
                        [np.sin(pos), np.cos(pos),0],
@@ -195,11 +205,11 @@ def derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z
                        [np.sin(anom), np.cos(anom),0],
                        [     0      ,       0     ,1]])
     P321 = np.matmul(P3pos,np.matmul(P2inc,P1ano))
-    MODPLANE = np.matmul(P321,IMPLANE) 
+    MODPLANE = np.tensordot(P321, IMPLANE, axes=1) 
     
-    X = MODPLANE[0][0] + X0
-    Y = MODPLANE[1][0] + Y0
-    Z = MODPLANE[2][0] + Z0
+    X = MODPLANE[0] + X0
+    Y = MODPLANE[1] + Y0
+    Z = MODPLANE[2] + Z0
     
     RXY2 = X**2 + Y**2
     RXY = np.sqrt(RXY2)
@@ -210,9 +220,9 @@ def derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z
     if DEG:
         AZ = np.rad2deg(AZ)
         EL = np.rad2deg(EL)
-    if r or az or el:
+    if _nonzero(r, az, el):
         return [R,AZ,EL]          
-    elif x or y or z:
+    elif _nonzero(x, y, z):
         return [X,Y,Z]
         
 """
@@ -227,12 +237,12 @@ def g_exp_rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=
         anom= np.deg2rad(anom)
         AZ = np.deg2rad(AZ)
         EL = np.deg2rad(EL)     
-    if R or AZ or EL:
+    if _nonzero(R, AZ, EL):
         THE = np.pi/2 -  EL
         X = R*np.cos(AZ)*np.sin(THE) - X0
         Y = R*np.sin(AZ)*np.sin(THE) - Y0
         Z = R*np.cos(THE)             - Z0
-    elif X or Y or Z:
+    elif _nonzero(X, Y, Z):
         X = X - X0
         Y = Y - Y0
         Z = Z - Z0
@@ -257,9 +267,9 @@ def g_exp_rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=
     if DEG:
         az = np.rad2deg(az)
         el = np.rad2deg(el)
-    if R or AZ or EL:
+    if _nonzero(R, AZ, EL):
         return [r,az,el]          
-    elif X or Y or Z:
+    elif _nonzero(X, Y, Z):
         return [x,y,z]
     
 def g_rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0):
@@ -269,16 +279,16 @@ def g_rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z
         anom= np.deg2rad(anom)
         AZ = np.deg2rad(AZ)
         EL = np.deg2rad(EL)     
-    if R or AZ or EL:
+    if _nonzero(R, AZ, EL):
         THE = np.pi/2 -  EL
         X = R*np.cos(AZ)*np.sin(THE) - X0
         Y = R*np.sin(AZ)*np.sin(THE) - Y0
         Z = R*np.cos(THE)            - Z0
-    elif X or Y or Z:
+    elif _nonzero(X, Y, Z):
         X = X - X0
         Y = Y - Y0
         Z = Z - Z0
-    IMPLANE = np.array([[Y],[X],[Z]])
+    IMPLANE = np.array(np.broadcast_arrays(Y, X, Z))
 
     P3pos = np.array([ [np.cos(-pos),-np.sin(-pos),0],
                        [np.sin(-pos), np.cos(-pos),0],
@@ -290,11 +300,11 @@ def g_rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z
                        [np.sin(-anom-np.pi/2), np.cos(-anom-np.pi/2),0],
                        [     0               ,      0               ,1]])
     P321 = np.matmul(P3pos,np.matmul(P2inc,P1ano))
-    MODPLANE = np.matmul(np.transpose(P321),IMPLANE) 
+    MODPLANE = np.tensordot(np.transpose(P321), IMPLANE, axes=1) 
 
-    x = MODPLANE[0][0]
-    y = MODPLANE[1][0]
-    z = MODPLANE[2][0]
+    x = MODPLANE[0]
+    y = MODPLANE[1]
+    z = MODPLANE[2]
     
     rxy2 = x**2 + y**2
     rxy = np.sqrt(rxy2)
@@ -305,9 +315,9 @@ def g_rotate(R=0, AZ=0, EL=0, X=0, Y=0, Z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z
     if DEG:
         az = np.rad2deg(az)
         el = np.rad2deg(el)
-    if R or AZ or EL:
+    if _nonzero(R, AZ, EL):
         return [r,az,el]          
-    elif X or Y or Z:
+    elif _nonzero(X, Y, Z):
         return [x,y,z]
   
 def g_exp_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0):
@@ -318,12 +328,12 @@ def g_exp_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y
         anom= np.deg2rad(anom)
         az = np.deg2rad(az)
         el = np.deg2rad(el)     
-    if r or az or el:
+    if _nonzero(r, az, el):
         the = np.pi/2 -  el
         x = r*np.cos(az)*np.sin(the)
         y = r*np.sin(az)*np.sin(the)
         z = r*np.cos(the)            
-    elif x or y or z:
+    elif _nonzero(x, y, z):
         x = x
         y = y
         z = z  
@@ -348,9 +358,9 @@ def g_exp_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y
     if DEG:
         AZ = np.rad2deg(AZ)
         EL = np.rad2deg(EL)
-    if r or az or el:
+    if _nonzero(r, az, el):
         return [R,AZ,EL]          
-    elif x or y or z:
+    elif _nonzero(x, y, z):
         return [X,Y,Z]
     
 def g_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0):
@@ -361,17 +371,17 @@ def g_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=0,
         anom= np.deg2rad(anom)
         az = np.deg2rad(az)
         el = np.deg2rad(el)     
-    if r or az or el:
+    if _nonzero(r, az, el):
         the = np.pi/2 -  el
         x = r*np.cos(az)*np.sin(the)
         y = r*np.sin(az)*np.sin(the)
         z = r*np.cos(the)             
-    elif x or y or z:
+    elif _nonzero(x, y, z):
         x = x
         y = y
         z = z
         
-    IMPLANE = np.array([[x],[y],[z]])
+    IMPLANE = np.array(np.broadcast_arrays(x, y, z))
 
     P3pos = np.array([ [np.cos(-pos),-np.sin(-pos),0],
                        [np.sin(-pos), np.cos(-pos),0],
@@ -383,11 +393,11 @@ def g_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=0,
                        [np.sin(-anom-np.pi/2), np.cos(-anom-np.pi/2),0],
                        [     0               ,      0               ,1]])
     P321 = np.matmul(P3pos,np.matmul(P2inc,P1ano))
-    MODPLANE = np.matmul(P321,IMPLANE) 
+    MODPLANE = np.tensordot(P321, IMPLANE, axes=1) 
     
-    Y = MODPLANE[0][0] + Y0
-    X = MODPLANE[1][0] + X0
-    Z = MODPLANE[2][0] + Z0
+    Y = MODPLANE[0] + Y0
+    X = MODPLANE[1] + X0
+    Z = MODPLANE[2] + Z0
     
     RXY2 = X**2 + Y**2
     RXY = np.sqrt(RXY2)
@@ -398,7 +408,373 @@ def g_derotate(r=0, az=0, el=0, x=0, y=0, z=0, inc=0, pos=0, anom=0, X0=0, Y0=0,
     if DEG:
         AZ = np.rad2deg(AZ)
         EL = np.rad2deg(EL)
-    if r or az or el:
+    if _nonzero(r, az, el):
         return [R,AZ,EL]          
-    elif x or y or z:
+    elif _nonzero(x, y, z):
         return [X,Y,Z]
+
+"""
+The following functions work on (N,3) arrays of points at once, in either convention.
+
+points     : (N,3) (or (3,)) array of points, columns are x/y/z or, if spherical is set, r/az/el
+spherical  : if left as False points are interpreted as cartesian, otherwise as spherical polar (r, az, el)
+convention : 'standard' for the convention of 'rotate'/'derotate', 'g' for that of 'g_rotate'/'g_derotate'
+out        : optional preallocated array of the same shape as points to write the result to
+inplace    : if True the result overwrites points (which must be a floating point numpy array), so no output array is allocated
+dtype      : dtype of the calculation and result, numpy.float64 by default. numpy.float32 halves the memory needed
+
+workers    : number of threads to process chunks of points on, 1 by default. 0 uses every CPU
+chunk_size : number of points processed at a time
+
+Points are processed in chunks so, other than points and the result, only small temporaries are allocated.
+With dtype=numpy.float32, writing s = |point| + |(X0,Y0,Z0)|, cartesian results are accurate to within 1e-6*s and the direction of a
+spherical result of radius r to within 1e-6*s/r radians (0.2 arcsec for points well away from the origin), compared with ~1e-15 for float64.
+
+All other arguments are as above. rotate_points/derotate_points take a single orientation, see 'rotate_grid'/'derotate_grid' for many.
+"""
+
+def rotation_matrices(inc=0, pos=0, anom=0, DEG=0, convention='standard'):
+    
+    """
+    
+    Returns the matrix/matrices P321 taking model frame cartesian coordinates to the (unoffset) Image frame.
+    Its transpose takes Image frame coordinates to the model frame.
+    inc, pos and anom are broadcast against each other, the returned array has shape (..., 3, 3).
+    
+    """
+    
+    if convention not in ('standard', 'g'):
+        raise ValueError("convention must be 'standard' or 'g'")
+    
+    inc = np.asarray(inc, dtype=float)
+    pos = np.asarray(pos, dtype=float)
+    anom = np.asarray(anom, dtype=float)
+    if DEG:
+        inc = np.deg2rad(inc)
+        pos = np.deg2rad(pos)
+        anom = np.deg2rad(anom)
+    if convention == 'g':
+        inc = -inc
+        pos = -pos
+        anom = -anom - np.pi/2
+    inc, pos, anom = np.broadcast_arrays(inc, pos, anom)
+        
+    c0 = np.cos(pos)
+    s0 = np.sin(pos)
+    c1 = np.cos(inc)
+    s1 = np.sin(inc)
+    c2 = np.cos(anom)
+    s2 = np.sin(anom)
+    
+    P321 = np.empty(inc.shape + (3, 3))
+    P321[..., 0, 0] = c0*c2 - c1*s0*s2
+    P321[..., 0, 1] = -c0*s2 - c1*s0*c2
+    P321[..., 0, 2] = s1*s0
+    P321[..., 1, 0] = s0*c2 + c1*c0*s2
+    P321[..., 1, 1] = c1*c0*c2 - s0*s2
+    P321[..., 1, 2] = -s1*c0
+    P321[..., 2, 0] = s1*s2
+    P321[..., 2, 1] = s1*c2
+    P321[..., 2, 2] = c1
+    
+    if convention == 'g':
+        P321 = P321[..., [1, 0, 2], :] # the g_ convention outputs (Y, X, Z)
+    return P321
+
+@lru_cache(maxsize=128)
+def _cached_matrix(inc, pos, anom, DEG, convention):
+    P321 = rotation_matrices(inc, pos, anom, DEG, convention)
+    P321.setflags(write=False) # shared between callers
+    return P321
+
+def _frame_matrix(inc, pos, anom, DEG, convention):
+    # fixed orientations are looked up in a small cache of recently used ones
+    return _cached_matrix(float(inc), float(pos), float(anom), bool(DEG), convention)
+
+def _sph_to_cart(points, DEG=0):
+    r = points[..., 0]
+    az = points[..., 1]
+    el = points[..., 2]
+    if DEG:
+        az = np.deg2rad(az)
+        el = np.deg2rad(el)
+    cosel = np.cos(el)
+    return np.stack([r*np.cos(az)*cosel, r*np.sin(az)*cosel, r*np.sin(el)], axis=-1)
+
+def _cart_to_sph(points, DEG=0, out=None):
+    x = points[..., 0]
+    y = points[..., 1]
+    z = points[..., 2]
+    rxy2 = x**2 + y**2
+    r = np.sqrt(rxy2 + z**2)
+    az = np.arctan2(y, x)
+    el = np.arctan2(z, np.sqrt(rxy2, out=rxy2), out=rxy2)
+    if DEG:
+        np.rad2deg(az, out=az)
+        np.rad2deg(el, out=el)
+    if out is None:
+        return np.stack([r, az, el], axis=-1)
+    out[..., 0] = r
+    out[..., 1] = az
+    out[..., 2] = el
+    return out
+
+def _transform(points, matrix, before=None, after=None, spherical=False, DEG=0, out=None, inplace=False, dtype=None, workers=1, chunk_size=2**16):
+    # out = matrix @ (points - before) + after, in either coordinate form.
+    # Rows are processed chunk_size at a time so temporaries stay small, peak memory is that of points and out.
+    if inplace:
+        if out is not None:
+            raise ValueError('Please specify only one of out and inplace')
+        if not isinstance(points, np.ndarray) or points.dtype.kind != 'f':
+            raise ValueError('inplace requires points to be a floating point numpy array')
+        out = points
+    else:
+        points = np.asarray(points)
+    if points.shape[-1] != 3 or points.ndim > 2:
+        raise ValueError('points must have shape (N,3) or (3,)')
+    if dtype is None:
+        dtype = out.dtype if out is not None else np.float64
+    dtype = np.dtype(dtype)
+    if out is None:
+        out = np.empty(points.shape, dtype=dtype)
+    elif out.shape != points.shape or out.dtype != dtype:
+        raise ValueError('out must have shape {} and dtype {}'.format(points.shape, dtype))
+
+    single = points.ndim == 1
+    if single:
+        points = points[None, :]
+        out = out[None, :]
+    matrixT = np.ascontiguousarray(matrix.T, dtype=dtype)
+
+    def run(start):
+        sl = slice(start, start + chunk_size)
+        block = points[sl].astype(dtype) # always a copy, so out may be points
+        if spherical:
+            block = _sph_to_cart(block, DEG)
+        if before is not None:
+            block -= before.astype(dtype)
+        np.matmul(block, matrixT, out=out[sl])
+        if after is not None:
+            out[sl] += after.astype(dtype)
+        if spherical:
+            _cart_to_sph(out[sl], DEG, out=out[sl])
+            
+    starts = range(0, len(points), chunk_size)
+    if workers == 1 or len(starts) == 1:
+        for start in starts:
+            run(start)
+    else:
+        # numpy releases the GIL in its loops so threads writing disjoint chunks of out run in parallel
+        with ThreadPoolExecutor(max_workers=workers if workers > 0 else os.cpu_count()) as pool:
+            list(pool.map(run, starts))
+    return out[0] if single else out
+
+def rotate_points(points, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, spherical=False, convention='standard', out=None, inplace=False, dtype=None, workers=1, chunk_size=2**16):
+    
+    """Image to Model, for an (N,3) array of points. Returns an (N,3) array in the same form as the input."""
+    
+    return OrbitFrame(inc, pos, anom, X0, Y0, Z0, DEG, convention).to_model(points, spherical, out, inplace, dtype, workers, chunk_size)
+
+def derotate_points(points, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, spherical=False, convention='standard', out=None, inplace=False, dtype=None, workers=1, chunk_size=2**16):
+    
+    """Model to Image, for an (N,3) array of points. Returns an (N,3) array in the same form as the input."""
+    
+    return OrbitFrame(inc, pos, anom, X0, Y0, Z0, DEG, convention).to_image(points, spherical, out, inplace, dtype, workers, chunk_size)
+
+def g_rotate_points(points, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, spherical=False, out=None, inplace=False, dtype=None, workers=1, chunk_size=2**16):
+    return rotate_points(points, inc, pos, anom, X0, Y0, Z0, DEG, spherical, 'g', out, inplace, dtype, workers, chunk_size)
+
+def g_derotate_points(points, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, spherical=False, out=None, inplace=False, dtype=None, workers=1, chunk_size=2**16):
+    return derotate_points(points, inc, pos, anom, X0, Y0, Z0, DEG, spherical, 'g', out, inplace, dtype, workers, chunk_size)
+
+def _grid_transform(points, matrices, before, after, spherical, DEG, max_bytes, out):
+    # out[m] = matrices[m] @ (points - before[m]) + after[m], processed a chunk of orientations at a time
+    points = np.asarray(points, dtype=float)
+    if points.ndim != 2 or points.shape[1] != 3:
+        raise ValueError('points must have shape (N,3)')
+    if spherical:
+        points = _sph_to_cart(points, DEG)
+    M = len(matrices)
+    N = len(points)
+    shift = after - np.einsum('mij,mj->mi', matrices, before)
+    if out is None:
+        out = np.empty((M, N, 3))
+    elif out.shape != (M, N, 3):
+        raise ValueError('out must have shape {}'.format((M, N, 3)))
+    
+    chunk = max(1, int(max_bytes // (max(N, 1)*3*8*(3 if spherical else 1)))) # spherical output needs temporaries for the conversion
+    for start in range(0, M, chunk):
+        sl = slice(start, start + chunk)
+        block = np.matmul(points, np.swapaxes(matrices[sl], -1, -2))
+        block += shift[sl, None, :]
+        if spherical:
+            block = _cart_to_sph(block, DEG)
+        out[sl] = block
+    return out
+
+def _grid_args(inc, pos, anom, X0, Y0, Z0, DEG, convention):
+    inc, pos, anom, X0, Y0, Z0 = np.broadcast_arrays(*(np.ravel(np.asarray(a, dtype=float)) for a in (inc, pos, anom, X0, Y0, Z0)))
+    return rotation_matrices(inc, pos, anom, DEG, convention), np.stack([X0, Y0, Z0], axis=-1)
+
+def rotate_grid(points, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, spherical=False, convention='standard', max_bytes=2**28, out=None):
+    
+    """
+    
+    Image to Model for the same (N,3) points under M orientations at once, e.g. for grid searches or MCMC over (inc, pos, anom).
+    inc, pos, anom and the offsets X0, Y0, Z0 are broadcast to (M,), the result is an (M,N,3) array.
+    Orientations are processed in chunks so that temporaries stay within roughly 'max_bytes' bytes.
+    'out' may be a preallocated (M,N,3) array (e.g. a numpy.memmap) to write the result to.
+    
+    """
+    
+    P321, offsets = _grid_args(inc, pos, anom, X0, Y0, Z0, DEG, convention)
+    return _grid_transform(points, np.swapaxes(P321, -1, -2), offsets, np.zeros_like(offsets), spherical, DEG, max_bytes, out)
+
+def derotate_grid(points, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, spherical=False, convention='standard', max_bytes=2**28, out=None):
+    
+    """Model to Image for the same (N,3) points under M orientations at once, see 'rotate_grid'."""
+    
+    P321, offsets = _grid_args(inc, pos, anom, X0, Y0, Z0, DEG, convention)
+    return _grid_transform(points, P321, np.zeros_like(offsets), offsets, spherical, DEG, max_bytes, out)
+
+def _rotation_matrix_derivatives(inc, pos, anom, convention='standard'):
+    # derivatives of P321 with respect to inc, pos and anom (radians), stacked as a (3,3,3) array
+    sign = 1
+    if convention == 'g':
+        inc, pos, anom = -inc, -pos, -anom - np.pi/2
+        sign = -1
+    c0 = np.cos(pos)
+    s0 = np.sin(pos)
+    c1 = np.cos(inc)
+    s1 = np.sin(inc)
+    c2 = np.cos(anom)
+    s2 = np.sin(anom)
+    dinc = np.array([[ s1*s0*s2,  s1*s0*c2,  c1*s0],
+                     [-s1*c0*s2, -s1*c0*c2, -c1*c0],
+                     [    c1*s2,     c1*c2,    -s1]])
+    dpos = np.array([[-s0*c2 - c1*c0*s2,  s0*s2 - c1*c0*c2, s1*c0],
+                     [ c0*c2 - c1*s0*s2, -c0*s2 - c1*s0*c2, s1*s0],
+                     [                0,                 0,     0]])
+    danom = np.array([[-c0*s2 - c1*s0*c2, -c0*c2 + c1*s0*s2, 0],
+                      [-s0*s2 + c1*c0*c2, -s0*c2 - c1*c0*s2, 0],
+                      [            s1*c2,            -s1*s2, 0]])
+    derivatives = sign*np.stack([dinc, dpos, danom])
+    if convention == 'g':
+        derivatives = derivatives[:, [1, 0, 2], :]
+    return derivatives
+
+def fit_frame(points, IMPLANE, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, convention='standard', fixed=(), **kwargs):
+    
+    """
+    
+    Fits the orientation and offsets of the model frame to observed Image frame positions of known model frame points.
+    Minimises the squared residuals between derotate_points(points, ...) and IMPLANE with scipy.optimize.least_squares,
+    using the analytic Jacobian of the rotation evaluated over all points at once.
+    Returns a dictionary of the fitted inc, pos, anom, X0, Y0, Z0 (angles in degrees if DEG is set) and the full least_squares 'result'.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    points:      (N,3) array of model frame cartesian positions, e.g. from Kepler.orbit_positions.
+    
+    IMPLANE:     (N,3) array of the observed Image frame cartesian positions of those points, or (N,2) if only X and Y are observed
+                 (e.g. positions on the sky), in which case Z0 is held fixed.
+                 
+    inc, pos, anom, X0, Y0, Z0: Starting values of the fit.
+    
+    DEG, convention: as for derotate_points.
+    
+    fixed:       Names of parameters to hold at their starting values, e.g. ('Z0',).
+    
+    kwargs:      Passed on to scipy.optimize.least_squares, e.g. loss='soft_l1' for robustness against outliers.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    from scipy.optimize import least_squares
+    
+    names = ['inc', 'pos', 'anom', 'X0', 'Y0', 'Z0']
+    points = np.asarray(points, dtype=float)
+    IMPLANE = np.asarray(IMPLANE, dtype=float)
+    if points.ndim != 2 or points.shape[1] != 3 or IMPLANE.shape[0] != points.shape[0] or IMPLANE.shape[1] not in (2, 3):
+        raise ValueError('points must have shape (N,3) and IMPLANE shape (N,3) or (N,2)')
+    ncomp = IMPLANE.shape[1]
+    fixed = set(fixed) | ({'Z0'} if ncomp == 2 else set())
+    if not fixed <= set(names):
+        raise ValueError('fixed must only contain names from {}'.format(names))
+    free = [i for i, name in enumerate(names) if name not in fixed]
+    
+    start = np.array([inc, pos, anom, X0, Y0, Z0], dtype=float)
+    if DEG:
+        start[:3] = np.deg2rad(start[:3])
+    
+    def full(params):
+        values = start.copy()
+        values[free] = params
+        return values
+    
+    def residuals(params):
+        values = full(params)
+        P321 = rotation_matrices(*values[:3], convention=convention)
+        return (points @ P321[:ncomp].T + values[3:3 + ncomp] - IMPLANE).ravel()
+    
+    def jacobian(params):
+        values = full(params)
+        jac = np.zeros((len(points), ncomp, 6))
+        jac[:, :, :3] = np.einsum('kij,nj->nik', _rotation_matrix_derivatives(*values[:3], convention=convention)[:, :ncomp], points)
+        jac[:, :, 3:3 + ncomp] = np.eye(ncomp)
+        return jac.reshape(-1, 6)[:, free]
+    
+    result = least_squares(residuals, start[free], jac=jacobian, **kwargs)
+    
+    values = full(result.x)
+    if DEG:
+        values[:3] = np.rad2deg(values[:3])
+    fit = dict(zip(names, values))
+    fit['result'] = result
+    return fit
+
+class OrbitFrame:
+    
+    """
+    
+    A fixed orbit orientation and offset, for repeatedly moving points between the Image and model frames.
+    The rotation matrix and its transpose are computed once on creation, recently used orientations are cached so recreating a frame is cheap.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    inc, pos, anom, X0, Y0, Z0, DEG: as for 'rotate'/'derotate' above, angles must be scalars.
+    
+    convention: 'standard' for the convention of 'rotate'/'derotate', 'g' for that of 'g_rotate'/'g_derotate'.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    def __init__(self, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, convention='standard'):
+        if np.ndim(inc) or np.ndim(pos) or np.ndim(anom):
+            raise ValueError('OrbitFrame takes a single orientation, see rotation_matrices for arrays of orientations')
+        self.inc = inc
+        self.pos = pos
+        self.anom = anom
+        self.DEG = DEG
+        self.convention = convention
+        self.offset = np.array([X0, Y0, Z0], dtype=float)
+        self.matrix = _frame_matrix(inc, pos, anom, DEG, convention)
+        self.inverse = np.ascontiguousarray(self.matrix.T)
+        
+    def __repr__(self):
+        return 'OrbitFrame(inc={}, pos={}, anom={}, X0={}, Y0={}, Z0={}, DEG={}, convention={!r})'.format(
+            self.inc, self.pos, self.anom, *self.offset, self.DEG, self.convention)
+        
+    def to_model(self, points, spherical=False, out=None, inplace=False, dtype=None, workers=1, chunk_size=2**16):
+        """Image to Model, as 'rotate_points'."""
+        return _transform(points, self.inverse, before=self.offset, spherical=spherical, DEG=self.DEG, out=out, inplace=inplace, dtype=dtype, workers=workers, chunk_size=chunk_size)
+    
+    def to_image(self, points, spherical=False, out=None, inplace=False, dtype=None, workers=1, chunk_size=2**16):
+        """Model to Image, as 'derotate_points'."""
+        return _transform(points, self.matrix, after=self.offset, spherical=spherical, DEG=self.DEG, out=out, inplace=inplace, dtype=dtype, workers=workers, chunk_size=chunk_size)
@@ -0,0 +1,67 @@
+import numpy as np
+import Rotation as rot
+
+def sky_image(points, npix, pixscale, centre=(0,0), weights=None, inc=0, pos=0, anom=0, X0=0, Y0=0, Z0=0, DEG=0, convention='standard', spherical=False, chunk_size=2**20, image=None):
+
+    """
+
+    Rasterises a model frame particle cloud onto a sky image.
+    Particles are derotated into the Image frame (see Rotation.py) and summed onto a pixel grid in the Image X-Y plane, i.e. Z is taken as the line of sight.
+    Particles are processed 'chunk_size' at a time so memory use is bounded whatever the number of particles, 'points' and 'weights' may be numpy.memmaps.
+    Returns an (ny, nx) array indexed as image[Y pixel, X pixel], particles falling outside the grid are ignored.
+
+    ---------------------------------------------------------------------------------------------------------
+
+    Parameters:
+
+    points:       (N,3) array of model frame particle positions, cartesian x/y/z or, if spherical is set, r/az/el.
+
+    npix:         Number of pixels along each side of the image, or (ny, nx).
+
+    pixscale:     Size of a pixel in the same units as the particle positions.
+
+    centre:       (X, Y) Image frame position of the centre of the image, in the same units as the particle positions.
+
+    weights:      Optional (N,) array of per-particle weights/fluxes, if left as None each particle counts as 1.
+
+    inc, pos, anom, X0, Y0, Z0, DEG, convention, spherical: Orientation and offsets of the model frame, as for Rotation.derotate_points.
+
+    chunk_size:   Number of particles derotated and binned at a time.
+
+    image:        Optional existing (ny, nx) image to add to, e.g. to build up an image from several calls.
+
+    --------------------------------------------------------------------------------------------------------
+
+    """
+
+    ny, nx = (npix, npix) if np.ndim(npix) == 0 else npix
+    if image is None:
+        image = np.zeros((ny, nx))
+    elif image.shape != (ny, nx):
+        raise ValueError('image must have shape {}'.format((ny, nx)))
+    if weights is not None and len(weights) != len(points):
+        raise ValueError('weights must have one entry per particle')
+
+    frame = rot.OrbitFrame(inc, pos, anom, X0, Y0, Z0, DEG, convention)
+
+    #Image frame position of the lower left corner of the grid
+    Xlow = centre[0] - nx*pixscale/2
+    Ylow = centre[1] - ny*pixscale/2
+
+    flat = np.zeros(ny*nx)
+    for start in range(0, len(points), chunk_size):
+        chunk = np.asarray(points[start:start + chunk_size], dtype=float)
+        if spherical:
+            chunk = rot._sph_to_cart(chunk, DEG)
+        IMPLANE = frame.to_image(chunk)
+        ix = np.floor((IMPLANE[:, 0] - Xlow)/pixscale)
+        iy = np.floor((IMPLANE[:, 1] - Ylow)/pixscale)
+        inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        index = iy[inside].astype(np.intp)*nx + ix[inside].astype(np.intp)
+        if weights is None:
+            flat += np.bincount(index, minlength=ny*nx)
+        else:
+            flat += np.bincount(index, weights=np.asarray(weights[start:start + chunk_size])[inside], minlength=ny*nx)
+
+    image += flat.reshape(ny, nx)
+    return image
@@ -1,15 +1,44 @@
+import os
+import json
+import hashlib
+import warnings
 import numpy as np
 import SkyScale as ss
 from astropy import units as u
-from astropy.coordinates import SkyCoord
 
-def GalacticCoords(Ra,Dec):
+#Rotation matrix from ICRS to Galactic cartesian coordinates, as used by astropy
+#(galactic pole and longitude defined in FK5 J2000, combined with the FK5-ICRS frame bias).
+ICRS_TO_GALACTIC = np.array([[-0.05487565771259163, -0.8734370519556159 , -0.48383507361671546],
+                             [ 0.4941094371927268 , -0.4448297212232952 ,  0.7469821839866676 ],
+                             [-0.8676661375596576 , -0.19807633727300053,  0.4559838136873016 ]])
+
+def _rotate_lonlat(lon, lat, matrix):
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+    coslat = np.cos(lat)
+    vec = np.stack([coslat*np.cos(lon), coslat*np.sin(lon), np.sin(lat)])
+    x, y, z = np.tensordot(matrix, vec, axes=1)
+    return np.degrees(np.arctan2(y, x)) % 360, np.degrees(np.arctan2(z, np.hypot(x, y)))
+
+def icrs_to_galactic(ra, dec):
+    
+    """Converts icrs ra, dec (degrees, floats or arrays) to galactic l, b (degrees) with a fixed rotation matrix, agreeing with astropy to well below a milliarcsecond."""
+    
+    return _rotate_lonlat(ra, dec, ICRS_TO_GALACTIC)
+
+def galactic_to_icrs(l, b):
+    
+    """Converts galactic l, b (degrees, floats or arrays) to icrs ra, dec (degrees), the inverse of icrs_to_galactic."""
+    
+    return _rotate_lonlat(l, b, ICRS_TO_GALACTIC.T)
+
+def GalacticCoords(Ra, Dec, use_astropy=False):
     
     """
     
     Quickly converts icrs Ra, Dec coordinates to galactic l, b coordinates.
     Assumes units of degrees if no astropy units specified.
-    Returns floats l and b.
+    Returns floats (or arrays) l and b in degrees.
     
     ---------------------------------------------------------------------------------------------------------
     
@@ -19,21 +48,139 @@ def GalacticCoords(Ra,Dec):
     
     Dec:          Declination of sky location to be converted. Units in astropy units of choice or degrees if left unitless.
     
+    use_astropy:  If True the conversion is done with an astropy SkyCoord rather than the fixed rotation of icrs_to_galactic.
+    
     --------------------------------------------------------------------------------------------------------
     
     """
     
-    if type(Ra) != type(1*u.degree): #Check to see if input type == astropy.units.quantity.Quantity
-        Ra *= u.degree
+    if type(Ra) == type(1*u.degree): #Check to see if input type == astropy.units.quantity.Quantity
+        Ra = Ra.to(u.degree).value
         
-    if type(Dec) != type(1*u.degree):
-        Dec *= u.degree
-        
-    Coords = SkyCoord(ra=Ra,dec = Dec, frame = 'icrs')
+    if type(Dec) == type(1*u.degree):
+        Dec = Dec.to(u.degree).value
+    
+    if use_astropy:
+        from astropy.coordinates import SkyCoord
+        Coords = SkyCoord(ra=Ra*u.degree,dec = Dec*u.degree, frame = 'icrs')
+        return Coords.galactic.l.value,Coords.galactic.b.value
+    
+    return icrs_to_galactic(Ra, Dec)
+
+TypeList = ['Os','Bs','As','Fs','FDs','Gs','GDs','KDs','MDs','WDs','ESs','RGs','ALL']#D stands for Dwarf, RG stands for Red Giant
+DensList = [4.4e-8,3.2e-5,4.9e-4,0.0025,0.0024,0.0048,0.0033,0.0135,0.0917,0.0048,8.8e-4,2.7e-4,0.0984]
+
+#table 10 Juric et al 2008
+#         #error
+R0 = 8000
+L = 2600  #+-20
+Lt = 3600 #+-20%
+Z0 = 25   #+-20%
+H = 300   #+-20%
+Ht = 900  #+-20%
+f = 0.12  #+-10%
+
+def _sky_area(maxdist, Area=None, Radius=None, Side=None):
+    
+    #calculate the area of the shape on sky in square degrees
+    if Area is None:
+        if Radius is not None and Side is not None:
+            raise ValueError('Please specify only one of Area, Radius or Side.')
+            
+        if Radius is not None:
+            if type(1.0*Radius) == float:
+                Area = np.pi*Radius**2
+            elif Radius.decompose().unit == u.rad:
+                Area = np.pi*(Radius.to(u.degree).value)**2
+            elif Radius.decompose().unit == u.m:
+                Area = np.pi*(ss.sky_scale(size=Radius, distance=maxdist,angle=u.degree).value)**2
+
+        elif Side is not None:
+            if type(1.0*Side) == float:
+                Area = Side**2
+            elif Side.decompose().unit == u.rad:
+                Area = (Side.to(u.degree).value)**2
+            elif Side.decompose().unit == u.m:
+                Area = (ss.sky_scale(size=Side, distance=maxdist,angle=u.degree).value)**2
+    else:
+        if Radius is not None or Side is not None :
+            raise ValueError('Please specify only one of Area, Radius or Side.')
+        elif type(Area) == type(1*u.rad):
+            Area = Area.to(u.degree*u.degree).value
+    return Area
+
+def _los_factors(l, b):
+    
+    #prep conversions into cylindrical coordinates for use in density equation
+    sphtheta = np.asarray(b) + 90
+    sphphi = np.asarray(l)
+    cylrhofact = np.sin(sphtheta*np.pi/180)
+    cylzfact =-1*np.cos(sphtheta*np.pi/180)
+    cylphi = sphphi
+    Rfact = -1*np.cos(cylphi*np.pi/180)
+    return cylrhofact, cylzfact, Rfact
+
+def _normdens(sphr, cylrhofact, cylzfact, Rfact, params=None):
+    
+    #normalised Juric density at distance sphr along the line of sight, params may override (and broadcast) the Juric parameters
+    p = {'R0': R0, 'L': L, 'Lt': Lt, 'Z0': Z0, 'H': H, 'Ht': Ht, 'f': f}
+    if params is not None:
+        p.update(params)
+    cylrho = sphr*cylrhofact
+    cylz = sphr*cylzfact  
+    R = cylrho*Rfact  + p['R0']#galactocentric
+    Z = cylz
+    dens = np.exp((p['R0']-R)/p['L'])*np.exp(-(Z+p['Z0'])/p['H']) +p['f']*np.exp((p['R0']-R)/p['Lt'])*np.exp(-(Z+p['Z0'])/p['Ht'])
+    if 'fH' in p:
+        #Juric et al 2008 halo, equation 24
+        dens = dens + p['fH']*(p['R0']**2/(R**2 + ((Z+p['Z0'])/p['qH'])**2))**(p['nH']/2)
+    return dens
+
+def _los_integral(factors, maxdist, interval=150, method='riemann', tol=1e-6, order=8, maxpanels=2**14):
+    
+    """
+    
+    Integral of normalised density * distance**2 along lines of sight out to maxdist, and the same integral of distance**2.
+    factors (from _los_factors) and maxdist may be arrays, integrals are evaluated for all of them at once.
+    
+    'riemann' uses the 'interval' step sum of star_count.
+    'quad' uses composite Gauss-Legendre quadrature, doubling the number of panels until successive estimates agree to within relative tolerance 'tol'.
     
-    return Coords.galactic.l.value,Coords.galactic.b.value
+    """
+    
+    factors = [np.asarray(fac, dtype=float)[..., None] for fac in factors]
+    maxdist = np.asarray(maxdist, dtype=float)[..., None]
+    
+    if method == 'riemann':
+        sphr = maxdist/interval*np.arange(1, interval + 1)
+        smalldist = maxdist[..., 0]/interval
+        return (np.sum(_normdens(sphr, *factors)*sphr**2, axis=-1)*smalldist,
+                np.sum(sphr**2, axis=-1)*smalldist)
+    elif method != 'quad':
+        raise ValueError("method must be 'riemann' or 'quad'")
+    
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    nodes = (nodes + 1)/2
+    weights = weights/2
+    
+    def estimate(panels):
+        #nodes of every panel along the line of sight, shape (..., panels*order)
+        sphr = maxdist*((np.arange(panels)[:, None] + nodes)/panels).ravel()
+        return np.sum(_normdens(sphr, *factors)*sphr**2*np.tile(weights, panels), axis=-1)*maxdist[..., 0]/panels
+    
+    panels = 1
+    old = estimate(panels)
+    while True:
+        panels *= 2
+        new = estimate(panels)
+        if np.all(np.abs(new - old) <= tol*np.abs(new)):
+            break
+        if panels >= maxpanels:
+            raise RuntimeError('star_count quadrature did not reach tolerance {} with {} panels'.format(tol, panels))
+        old = new
+    return new, maxdist[..., 0]**3/3
 
-def star_count(Ra, Dec, maxdist, interval=150, Area=None, Radius=None, Side=None ):
+def star_count(Ra, Dec, maxdist, interval=150, Area=None, Radius=None, Side=None, method='riemann', tol=1e-6):
     
     """
     
@@ -59,90 +206,30 @@ def star_count(Ra, Dec, maxdist, interval=150, Area=None, Radius=None, Side=None
     
     Side: The side of the square on the sky in which you wish to count stars up to 'maxdist'. Units in astropy size/length units of choice or degrees if left unitless.
     
+    method: 'riemann' for the fixed 'interval' step integration, 'quad' for Gauss-Legendre quadrature refined until accurate to relative tolerance 'tol'.
+    
+    tol: Relative tolerance of the 'quad' integration.
+    
     --------------------------------------------------------------------------------------------------------
     
     """
 
+    Area = _sky_area(maxdist, Area, Radius, Side)
     
-    #calculate the area of the shape on sky
-    if not Area:
-        if Radius != None and Side != None:
-            raise ValueError('Please specify only one of Area, Radius or Side.')
-            
-        if Radius != None:
-            if type(1.0*Radius) == float:
-                Area = np.pi*Radius**2
-            elif Radius.decompose().unit == u.rad:
-                Area = np.pi*(Radius.to(u.degree).value)**2
-            elif Radius.decompose().unit == u.m:
-                Area = np.pi*(ss.sky_scale(size=Radius, distance=maxdist,angle=u.degree).value)**2
-
-        elif Side != None:
-            if type(1.0*Side) == float:
-                Area = Side**2
-            elif Side.decompose().unit == u.rad:
-                Area = (Side.to(u.degree).value)**2
-            elif Side.decompose().unit == u.m:
-                Area = (ss.sky_scale(size=Side, distance=maxdist,angle=u.degree).value)**2
-    else:
-        if Radius != None or Side != None :
-            raise ValueError('Please specify only one of Area, Radius or Side.')
-        elif type(Area) == type(1*u.rad):
-            Area = Area.to(u.degree*u.degree).value
-        
-    TypeList = ['Os','Bs','As','Fs','FDs','Gs','GDs','KDs','MDs','WDs','ESs','RGs','ALL']#D stands for Dwarf, RG stands for Red Giant
-    DensList = [4.4e-8,3.2e-5,4.9e-4,0.0025,0.0024,0.0048,0.0033,0.0135,0.0917,0.0048,8.8e-4,2.7e-4,0.0984]
     Dictionary = {'Count':0}
     Dict = {}
     
-    #table 10 Juric et al 2008
-    #         #error
-    R0 = 8000
-    L = 2600  #+-20
-    Lt = 3600 #+-20%
-    Z0 = 25   #+-20%
-    H = 300   #+-20%
-    Ht = 900  #+-20%
-    f = 0.12  #+-10%
-    
     l, b = GalacticCoords(Ra,Dec) # convert to galactic coordinates
     
-    #prep conversions into cylindrical coordinates for use in density equation
-    sphtheta = b + 90
-    sphphi = l
-    cylrhofact = np.sin(sphtheta*np.pi/180)
-    cylzfact =-1*np.cos(sphtheta*np.pi/180)
-    cylphi = sphphi
-    Rfact = -1*np.cos(cylphi*np.pi/180)
-    
     if type(maxdist) == type(1*u.parsec):
         maxdist = maxdist.to(u.parsec).value
     
-    smalldist=maxdist/interval
     areafraction = (Area/41252.96)
-    totvolume = 0
-    StarCount = np.zeros(len(TypeList))
     
-    #numerical integration of star densities
-    for i in range(1,interval+1):
-
-        sphr = i*smalldist
-        cylrho = sphr*cylrhofact
-        cylz = sphr*cylzfact  
-        R = cylrho*Rfact  + 8000#galactocentric
-        Z = cylz
-        
-        dens =[]
-        #calculate normalised density at interval location
-        normdens = (np.exp((R0-R)/L)*np.exp(-(Z+Z0)/H) +f*np.exp((R0-R)/Lt)*np.exp(-(Z+Z0)/Ht))
-
-        #calculate individual densities, the interval volume and star counts.
-        for i in range(0, len(TypeList)):  
-            dens.append(DensList[i]*normdens)
-        area = areafraction*4*np.pi*sphr**2
-        volume = area*smalldist
-        totvolume += volume
-        StarCount += np.array(dens)*volume
+    #numerical integration of star densities, the same for all types up to their density
+    integral, r2integral = _los_integral(_los_factors(l, b), maxdist, interval, method, tol)
+    totvolume = areafraction*4*np.pi*r2integral
+    StarCount = np.array(DensList)*areafraction*4*np.pi*integral
     
     #create output dictionary
     for i in range(0,len(TypeList)):
@@ -152,3 +239,364 @@ def star_count(Ra, Dec, maxdist, interval=150, Area=None, Radius=None, Side=None
     
     print('Total volume integrated is {} parsecs cubed'.format(totvolume))    
     return Dict
+
+def star_count_curve(Ra, Dec, maxdist, interval=150, Area=None, Radius=None, Side=None):
+    
+    """
+    
+    Cumulative star counts N(<d) of each type as a function of distance d, from a single star_count integration.
+    Returns a dictionary of arrays over the 'interval' integration steps:
+    'Distance' (the outer distance of each step in parsecs), 'ShellVolume' (volume of each step in cubic parsecs),
+    'Volume' (cumulative volume) and the cumulative count of each type in TypeList.
+    The last entry of each count is the star_count result for maxdist.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    Ra, Dec, maxdist, interval, Area, Radius, Side: as for star_count.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    Area = _sky_area(maxdist, Area, Radius, Side)
+    l, b = GalacticCoords(Ra,Dec)
+    if type(maxdist) == type(1*u.parsec):
+        maxdist = maxdist.to(u.parsec).value
+    
+    areafraction = (Area/41252.96)
+    smalldist = maxdist/interval
+    sphr = np.arange(1, interval + 1)*smalldist
+    ShellVolume = areafraction*4*np.pi*sphr**2*smalldist
+    CumCount = np.cumsum(_normdens(sphr, *_los_factors(l, b))*ShellVolume)
+    
+    Curve = {'Distance': sphr, 'ShellVolume': ShellVolume, 'Volume': np.cumsum(ShellVolume)}
+    for i in range(0, len(TypeList)):
+        Curve[TypeList[i]] = DensList[i]*CumCount
+    return Curve
+
+def _footprint_directions(Ra, Dec, order, Radius=None, Side=None):
+    
+    #quadrature nodes (Ra, Dec in degrees) and solid angle weights (steradians) covering a circle or square on the sky
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    ra0 = np.radians(Ra)
+    dec0 = np.radians(Dec)
+    
+    if Radius is not None:
+        #Gauss-Legendre in angular distance from the centre, uniform in position angle
+        rho = np.radians(Radius)
+        theta = rho*(nodes + 1)/2
+        phi = (np.arange(2*order) + 0.5)*np.pi/order
+        theta, phi = np.meshgrid(theta, phi, indexing='ij')
+        w = (rho/2*weights*np.sin(rho*(nodes + 1)/2))[:, None]*np.full(phi.shape, np.pi/order)
+        sindec = np.sin(dec0)*np.cos(theta) + np.cos(dec0)*np.sin(theta)*np.cos(phi)
+        dec = np.arcsin(np.clip(sindec, -1, 1))
+        ra = ra0 + np.arctan2(np.sin(phi)*np.sin(theta)*np.cos(dec0), np.cos(theta) - np.sin(dec0)*sindec)
+    else:
+        #Gauss-Legendre over the gnomonic projection of the square, centred on and aligned with Ra, Dec
+        half = np.tan(np.radians(Side)/2)
+        xi, eta = np.meshgrid(half*nodes, half*nodes, indexing='ij')
+        w = np.outer(weights, weights)*half**2*(1 + xi**2 + eta**2)**-1.5
+        denom = np.cos(dec0) - eta*np.sin(dec0)
+        dec = np.arctan2(np.sin(dec0) + eta*np.cos(dec0), np.sqrt(xi**2 + denom**2))
+        ra = ra0 + np.arctan2(xi, denom)
+    return np.degrees(ra).ravel() % 360, np.degrees(dec).ravel(), w.ravel()
+
+def star_count_footprint(Ra, Dec, maxdist, *, Radius=None, Side=None, tol=1e-4, maxorder=256):
+    
+    """
+    
+    star_count integrating over the whole footprint rather than scaling the density along the central line of sight by the area.
+    Densities are evaluated along lines of sight through quadrature nodes covering the circle or square, with all directions and distances in one array,
+    and the number of nodes is doubled until successive counts agree to within relative tolerance 'tol'.
+    The square is aligned with Ra and Dec. Returns a dictionary as star_count.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    Ra, Dec, maxdist, Radius, Side: as for star_count, one of Radius or Side must be given, Radius and Side by keyword.
+    
+    tol: Relative tolerance of both the line of sight and the footprint integration.
+    
+    maxorder: Largest number of nodes across the footprint to try before giving up.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    if (Radius is None) == (Side is None):
+        raise ValueError('Please specify one and only one of Radius or Side.')
+    if type(maxdist) == type(1*u.parsec):
+        maxdist = maxdist.to(u.parsec).value
+    if isinstance(Ra, u.Quantity):
+        Ra = Ra.to(u.degree).value
+    if isinstance(Dec, u.Quantity):
+        Dec = Dec.to(u.degree).value
+    size = Radius if Radius is not None else Side
+    if isinstance(size, u.Quantity):
+        if size.decompose().unit == u.rad:
+            size = size.to(u.degree).value
+        else:
+            size = ss.sky_scale(size=size, distance=maxdist, angle=u.degree).value
+    
+    order = 4
+    old = None
+    while True:
+        ra, dec, w = _footprint_directions(Ra, Dec, order, size if Radius is not None else None, size if Side is not None else None)
+        l, b = GalacticCoords(ra, dec)
+        integral = np.sum(w*_los_integral(_los_factors(l, b), maxdist, method='quad', tol=tol)[0])
+        if old is not None and abs(integral - old) <= tol*abs(integral):
+            break
+        if order >= maxorder:
+            raise RuntimeError('star_count_footprint did not reach tolerance {} with {} nodes across the footprint'.format(tol, order))
+        old = integral
+        order *= 2
+    
+    Dict = {}
+    for i in range(0,len(TypeList)):
+        Dict[TypeList[i]] = {'Count': DensList[i]*integral, 'Density': DensList[i]}
+    return Dict
+
+def _sky_area_array(maxdist, Area=None, Radius=None, Side=None):
+    
+    #vectorised _sky_area, maxdist in parsecs, returns square degrees
+    if sum(x is not None for x in (Area, Radius, Side)) != 1:
+        raise ValueError('Please specify one and only one of Area, Radius or Side.')
+    if Area is not None:
+        if isinstance(Area, u.Quantity):
+            return Area.to(u.degree*u.degree).value
+        return np.asarray(Area, dtype=float)
+    
+    size = Radius if Radius is not None else Side
+    if isinstance(size, u.Quantity):
+        if size.decompose().unit == u.rad:
+            size = size.to(u.degree).value
+        else:
+            size = np.degrees(np.arctan(size.to(u.parsec).value/maxdist))
+    size = np.asarray(size, dtype=float)
+    return np.pi*size**2 if Radius is not None else size**2
+
+def star_count_batch(Ra, Dec, maxdist, interval=150, Area=None, Radius=None, Side=None, method='riemann', tol=1e-6):
+    
+    """
+    
+    star_count for many pointings at once.
+    All line of sight integrals are evaluated together and the coordinates are converted in a single transform.
+    Returns a dictionary of arrays, one entry per pointing: 'l', 'b', 'Area' (square degrees), 'Volume' (cubic parsecs) and the count of each type in TypeList.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    Ra, Dec, maxdist, interval, Area, Radius, Side, method, tol: as for star_count, except that Ra, Dec, maxdist and the one of Area, Radius or Side given
+                                                                 may be arrays (or array Quantities), which are broadcast against each other.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    if isinstance(maxdist, u.Quantity):
+        maxdist = maxdist.to(u.parsec).value
+    maxdist = np.asarray(maxdist, dtype=float)
+    Area = _sky_area_array(maxdist, Area, Radius, Side)
+    
+    l, b = GalacticCoords(Ra, Dec)
+    l, b, maxdist, Area = np.broadcast_arrays(l, b, maxdist, Area)
+    
+    areafraction = Area/41252.96
+    integral, r2integral = _los_integral(_los_factors(l, b), maxdist, interval, method, tol)
+    
+    Table = {'l': l, 'b': b, 'Area': Area, 'Volume': areafraction*4*np.pi*r2integral}
+    for i in range(0, len(TypeList)):
+        Table[TypeList[i]] = DensList[i]*areafraction*4*np.pi*integral
+    return Table
+
+"""
+Precomputed all-sky maps.
+
+The log of the line of sight integral of the normalised density, divided by maxdist**3, is tabulated on a grid
+uniform in l and in b, with rows at both poles, and a logarithmic grid in distance, and cached on disk as a .npy file that is memory-mapped on use.
+The counts of each type are then that integral times the current DensList, so changing DensList needs no rebuild,
+while changing any of the Juric parameters above or the grid gives a new cache file.
+"""
+
+_star_maps = {}
+
+def _star_map_key(nl, nb, nd, dmin, dmax):
+    params = {'R0': R0, 'L': L, 'Lt': Lt, 'Z0': Z0, 'H': H, 'Ht': Ht, 'f': f,
+              'nl': nl, 'nb': nb, 'nd': nd, 'dmin': dmin, 'dmax': dmax, 'version': 2}
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+def _build_star_map(nl, nb, nd, dmin, dmax, order=16):
+    l = (np.arange(nl) + 0.5)*360/nl
+    b = np.linspace(-90, 90, nb)
+    dist = np.geomspace(dmin, dmax, nd)
+    lo = np.concatenate([[0], dist[:-1]])
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    sphr = lo[:, None] + (dist - lo)[:, None]*(nodes + 1)/2
+    
+    Map = np.empty((nb, nl, nd))
+    for i in range(nb):
+        factors = [fac[:, None, None] for fac in _los_factors(l, np.full(nl, b[i]))]
+        panels = np.sum(_normdens(sphr, *factors)*sphr**2*weights, axis=-1)*(dist - lo)/2
+        Map[i] = np.log(np.cumsum(panels, axis=-1)/dist**3)
+    return Map
+
+def load_star_map(nl=180, nb=180, nd=128, dmin=1, dmax=1e4, cache_dir=None):
+    
+    """
+    
+    Returns the (memory-mapped) all-sky map used by star_count_map, building and caching it first if needed.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    nl, nb:     Number of map cells in galactic longitude, and of galactic latitudes tabulated from pole to pole.
+    
+    nd:         Number of distances tabulated, logarithmically spaced between dmin and dmax parsecs.
+    
+    cache_dir:  Directory the map is cached in, ~/.cache/QuickAstroTools by default.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'QuickAstroTools')
+    path = os.path.join(cache_dir, 'star_map_{}.npy'.format(_star_map_key(nl, nb, nd, dmin, dmax)))
+    
+    if path not in _star_maps:
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmp, 'wb') as file:
+                np.save(file, _build_star_map(nl, nb, nd, dmin, dmax))
+            os.replace(tmp, path) # atomic, so concurrent builds never see a partial file
+        _star_maps[path] = np.load(path, mmap_mode='r')
+    return _star_maps[path]
+
+def star_count_map(Ra, Dec, maxdist, *, Area=None, Radius=None, Side=None, nl=180, nb=180, nd=128, dmin=1, dmax=1e4, cache_dir=None):
+    
+    """
+    
+    Fast approximate star_count_batch, interpolating a precomputed all-sky map (see load_star_map) in direction and distance.
+    Accuracy is limited by the map resolution. Against star_count_batch(method='quad', tol=1e-8) at 5000 random pointings, the default map
+    is within 0.6% for maxdist below 3 kpc and within 2% (0.5% of pointings worse than 1%) up to its dmax of 10 kpc.
+    Maps may be built out to larger dmax, but beyond 10 kpc the error grows to several % (20% by 100 kpc) and a warning is given.
+    Use star_count_batch where more accuracy is needed.
+    Returns a dictionary of arrays as star_count_batch.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    Ra, Dec, maxdist, Area, Radius, Side: as for star_count_batch, maxdist must be between dmin and dmax. All but Ra, Dec and maxdist are given by keyword.
+    
+    nl, nb, nd, dmin, dmax, cache_dir: map parameters, see load_star_map.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    if isinstance(maxdist, u.Quantity):
+        maxdist = maxdist.to(u.parsec).value
+    maxdist = np.asarray(maxdist, dtype=float)
+    if np.any(maxdist > dmax) or np.any(maxdist <= 0):
+        raise ValueError('maxdist must be between 0 and dmax = {} parsecs'.format(dmax))
+    Area = _sky_area_array(maxdist, Area, Radius, Side)
+    l, b = GalacticCoords(Ra, Dec)
+    l, b, maxdist, Area = np.broadcast_arrays(l, b, maxdist, Area)
+    
+    if np.any(maxdist > 1e4):
+        warnings.warn('star_count_map is only accurate to a few % or worse for maxdist beyond 10 kpc, use star_count_batch')
+    Map = load_star_map(nl, nb, nd, dmin, dmax, cache_dir)
+    
+    #fractional cell indices, periodic in l and clamped at dmin
+    il = np.remainder(l, 360)*nl/360 - 0.5
+    ib = np.clip((b + 90)*(nb - 1)/180, 0, nb - 1)
+    idist = np.clip(np.log(maxdist/dmin)/np.log(dmax/dmin)*(nd - 1), 0, nd - 1)
+    
+    l0 = np.floor(il).astype(int)
+    b0 = np.minimum(np.floor(ib).astype(int), nb - 2)
+    d0 = np.minimum(np.floor(idist).astype(int), nd - 2)
+    wl, wb, wd = il - l0, ib - b0, idist - d0
+    l0, l1 = l0 % nl, (l0 + 1) % nl
+    
+    #the map varies close to exponentially so is interpolated in log space
+    logintegral = 0
+    for bi, wbi in ((b0, 1 - wb), (b0 + 1, wb)):
+        for li, wli in ((l0, 1 - wl), (l1, wl)):
+            for di, wdi in ((d0, 1 - wd), (d0 + 1, wd)):
+                logintegral = logintegral + wbi*wli*wdi*Map[bi, li, di]
+    integral = np.exp(logintegral)*maxdist**3
+    
+    areafraction = Area/41252.96
+    Table = {'l': l, 'b': b, 'Area': Area, 'Volume': areafraction*4*np.pi*maxdist**3/3}
+    for i in range(0, len(TypeList)):
+        Table[TypeList[i]] = DensList[i]*areafraction*4*np.pi*integral
+    return Table
+
+#Juric et al 2008 halo parameters, table 10
+fH = 0.0051 #+-20%
+qH = 0.64   #+-0.01
+nH = 2.77   #+-0.2
+
+def star_count_uncertainty(Ra, Dec, maxdist, interval=150, Area=None, Radius=None, Side=None, ndraws=1000, halo=False, percentiles=(16,50,84), seed=None, max_bytes=2**27):
+    
+    """
+    
+    Propagates the uncertainties of the Juric et al 2008 density parameters through star_count.
+    Draws 'ndraws' parameter sets (L, Lt, Z0, H, Ht to +-20%, f to +-10%, Gaussian) and evaluates all of them along the line of sight
+    in one array, a chunk of draws at a time to keep temporaries within about 'max_bytes' bytes.
+    Optionally adds the stellar halo, with its parameters also drawn.
+    Returns a dictionary with 'Percentiles' and, for each type in TypeList, the corresponding percentiles of its count.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    Ra, Dec, maxdist, interval, Area, Radius, Side: as for star_count.
+    
+    ndraws: Number of parameter sets drawn.
+    
+    halo: If True the halo term of Juric et al 2008 is included.
+    
+    percentiles: Percentiles of the counts returned.
+    
+    seed: Seed for numpy.random.default_rng, for reproducible draws.
+    
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    Area = _sky_area(maxdist, Area, Radius, Side)
+    l, b = GalacticCoords(Ra,Dec)
+    if type(maxdist) == type(1*u.parsec):
+        maxdist = maxdist.to(u.parsec).value
+    
+    rng = np.random.default_rng(seed)
+    draws = {'L': rng.normal(L, 0.2*L, ndraws), 'Lt': rng.normal(Lt, 0.2*Lt, ndraws), 'Z0': rng.normal(Z0, 0.2*Z0, ndraws),
+             'H': rng.normal(H, 0.2*H, ndraws), 'Ht': rng.normal(Ht, 0.2*Ht, ndraws), 'f': rng.normal(f, 0.1*f, ndraws)}
+    if halo:
+        draws.update({'fH': rng.normal(fH, 0.2*fH, ndraws), 'qH': rng.normal(qH, 0.01, ndraws), 'nH': rng.normal(nH, 0.2, ndraws)})
+    for key in draws:
+        if key != 'Z0':
+            draws[key] = np.abs(draws[key]) #scale lengths and fractions must stay positive
+    
+    smalldist = maxdist/interval
+    sphr = np.arange(1, interval + 1)*smalldist
+    factors = _los_factors(l, b)
+    integral = np.empty(ndraws)
+    chunk = max(1, int(max_bytes//(8*interval*8))) #roughly 8 temporaries of (chunk, interval)
+    for start in range(0, ndraws, chunk):
+        params = {key: value[start:start + chunk, None] for key, value in draws.items()}
+        integral[start:start + chunk] = np.sum(_normdens(sphr, *factors, params=params)*sphr**2, axis=-1)*smalldist
+    
+    counts = np.percentile(np.outer(integral, DensList)*(Area/41252.96)*4*np.pi, percentiles, axis=0)
+    Table = {'Percentiles': np.asarray(percentiles)}
+    for i in range(0, len(TypeList)):
+        Table[TypeList[i]] = counts[:, i]
+    return Table
@@ -1,4 +1,7 @@
+import os
 import numpy as np
+from scipy.spatial import cKDTree
+import scipy.interpolate as interpolate
 from astropy import units as u
 
 def create_dictionary(filename):
@@ -160,3 +163,447 @@ def stellar_distance(dictionary, SpT=None, distance=None, magnitude=None, thresh
     
     else:
         print('Please enter two and only two of SpT, distance and magnitude')
+
+COLUMNS = ['SpT','Teff','logT','BCv','Mv','logL','B-V','Bt-Vt','V-G','U-B','V-Rc','V-Ic','V-Ks','J-H','H-Ks',
+           'Ks-W1','W1-W2','W1-W3','W1-W4','Msun','logAge','b-y','M_J','M_Ks','Mbol','i-z','z-Y','R_Rsun']
+
+class SpTTable:
+    
+    """
+    
+    Table of spectral types backed by a numpy structured array, see load_table.
+    
+    table['Mv'] gives a whole column as an array, table['A0V'] gives a row as a dictionary like those of create_dictionary,
+    and iterating over the table or using 'in' works with spectral types, so a table can be used wherever a dictionary from create_dictionary is.
+    table.index('A0V') gives the row number of a type and table.data is the structured array itself.
+    
+    """
+    
+    def __init__(self, data):
+        self.data = data
+        self.columns = list(data.dtype.names)
+        self.SpT = data['SpT']
+        self._rows = {SpT: i for i, SpT in enumerate(self.SpT.tolist())}
+        self._sorted = {}
+        self._trees = {}
+        self._interpolators = {}
+        
+    def __len__(self):
+        return len(self.data)
+    
+    def __iter__(self):
+        return iter(self._rows)
+    
+    def __contains__(self, SpT):
+        return SpT in self._rows
+    
+    def __getitem__(self, key):
+        if key in self._rows:
+            row = self.data[self._rows[key]]
+            return {column: (str(row[column]) if column == 'SpT' else float(row[column])) for column in self.columns}
+        if key in self.columns:
+            return self.data[key]
+        raise KeyError(key)
+    
+    def sorted_column(self, column):
+        
+        """Returns (values, rows): the finite values of 'column' in increasing order and the rows they come from, built once per column."""
+        
+        if column not in self._sorted:
+            values = np.asarray(self.data[column])
+            rows = np.flatnonzero(np.isfinite(values))
+            rows = rows[np.argsort(values[rows], kind='stable')]
+            self._sorted[column] = (values[rows], rows)
+        return self._sorted[column]
+    
+    def scales(self, columns):
+        
+        """Standard deviation of the finite entries of each of 'columns', used to normalise them for match_types."""
+        
+        return np.array([np.std(self.sorted_column(column)[0]) for column in columns])
+    
+    def tree(self, columns, scale):
+        
+        """Returns (tree, rows): a cKDTree over the rows with finite entries in all of 'columns', each divided by 'scale', built once per set of columns."""
+        
+        key = (tuple(columns), tuple(scale))
+        if key not in self._trees:
+            points = np.stack([np.asarray(self.data[column]) for column in columns], axis=-1)/scale
+            rows = np.flatnonzero(np.all(np.isfinite(points), axis=1))
+            self._trees[key] = (cKDTree(points[rows]), rows)
+        return self._trees[key]
+    
+    def interpolator(self, xcolumn, ycolumn, kind='pchip'):
+        
+        """
+        
+        Returns a dictionary describing a smooth mapping from 'xcolumn' to 'ycolumn' (e.g. 'Mv' to 'Teff'), built once per pair of columns:
+        'x', 'y' the table points used (rows where either is inf are skipped, y is averaged over rows with equal x),
+        'range' the (min, max) of x over which the mapping is valid and 'function' which maps an array of x to y, giving nan outside 'range'.
+        kind = 'pchip' gives a monotone piecewise cubic (it does not overshoot between rows), kind = 'linear' joins the rows with straight lines.
+        
+        """
+        
+        key = (xcolumn, ycolumn, kind)
+        if key not in self._interpolators:
+            x = np.asarray(self.data[xcolumn], dtype=float)
+            y = np.asarray(self.data[ycolumn], dtype=float)
+            valid = np.isfinite(x) & np.isfinite(y)
+            x, inverse = np.unique(x[valid], return_inverse=True)
+            y = np.bincount(inverse, weights=y[valid])/np.bincount(inverse)
+            if len(x) < 2:
+                raise ValueError('Columns {} and {} share fewer than two finite rows'.format(xcolumn, ycolumn))
+            if kind == 'pchip':
+                function = interpolate.PchipInterpolator(x, y, extrapolate=False)
+            elif kind == 'linear':
+                function = interpolate.interp1d(x, y, bounds_error=False, fill_value=np.nan, assume_sorted=True)
+            else:
+                raise ValueError("kind must be 'pchip' or 'linear'")
+            self._interpolators[key] = {'x': x, 'y': y, 'range': (float(x[0]), float(x[-1])), 'function': function}
+        return self._interpolators[key]
+    
+    def index(self, SpT):
+        try:
+            return self._rows[SpT]
+        except KeyError:
+            raise ValueError("That spectral type is not supported, remember to include luminosity class, e.g. 'A0V', else please refer to http://www.pas.rochester.edu/~emamajek/EEM_dwarf_UBVIJHK_colors_Teff.txt for all available types")
+
+def _parse_table(filename):
+    file = np.loadtxt(filename, dtype=str)[:, :len(COLUMNS)]
+    dtype = [('SpT', 'U{}'.format(max(len(SpT) for SpT in file[:, 0])))] + [(column, float) for column in COLUMNS[1:]]
+    data = np.empty(len(file), dtype=dtype)
+    data['SpT'] = file[:, 0]
+    for i in range(1, len(COLUMNS)):
+        data[COLUMNS[i]] = file[:, i].astype(float)
+    return data
+
+def load_table(filename, cache=True):
+    
+    """
+    
+    Loads the table of spectral types used by create_dictionary as an SpTTable.
+    
+    The parsed table is cached as a binary .npy file next to the text file (filename + '.npy') and memory-mapped on later loads,
+    it is rebuilt whenever the text file is newer than the cache. If the cache cannot be written the table is simply parsed.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    filename: The name/location of the .txt file containing the stellar parameters, see create_dictionary.
+    
+    cache: If False the text file is always parsed and no cache is used.
+
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    path = filename + '.npy'
+    if cache and os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(filename):
+        return SpTTable(np.load(path, mmap_mode='r'))
+    
+    data = _parse_table(filename)
+    if cache:
+        tmp = '{}.{}.tmp.npy'.format(filename, os.getpid())
+        try:
+            np.save(tmp, data)
+            os.replace(tmp, path) # atomic, so concurrent loads never see a partial file
+        except OSError:
+            pass
+    return SpTTable(data)
+
+def search_batch(values, column, table, thresh=0.2):
+    
+    """
+    
+    search for a whole array of values at once, using a sorted index of 'column' that skips inf/nan entries (see SpTTable.sorted_column).
+    Matches are rows within a factor 'thresh' of abs(value), so negative values (e.g. Mv, B-V) are matched in the same way as positive ones.
+    
+    Returns a dictionary of arrays:
+    'closest'           row of the closest finite entry to each value, or -1 if it is not within thresh or the value is not finite,
+    'closest_residual'  residual (table value - value) of the closest entry,
+    'query', 'rows', 'residuals'  one entry per match: the index of the value matched, the row matched and its residual, grouped by query.
+    Rows can be turned into spectral types with table.SpT[rows].
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    values: The approximate values of the property you are trying to match to types, an array.
+    
+    column: The type of property 'values' correspond to, a string defining the column in the table.
+    
+    table: The SpTTable to be searched, see load_table.
+    
+    thresh: The factor to which you wish your matches to be accurate by. e.g. thresh = 0.2 will return matches within 20% of each value.
+
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    values = np.asarray(values, dtype=float)
+    shape = values.shape
+    values = values.ravel()
+    sorted_values, rows = table.sorted_column(column)
+    finite = np.isfinite(values)
+    tolerance = np.abs(values)*thresh
+    
+    #range query
+    lo = np.searchsorted(sorted_values, values - tolerance, side='left')
+    hi = np.searchsorted(sorted_values, values + tolerance, side='right')
+    counts = np.where(finite, hi - lo, 0)
+    query = np.repeat(np.arange(len(values)), counts)
+    position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+    
+    #nearest neighbour, from the entries either side of each value's insertion point
+    right = np.clip(np.searchsorted(sorted_values, values), 1, len(sorted_values) - 1)
+    left = right - 1
+    nearest = np.where(np.abs(sorted_values[left] - values) <= np.abs(sorted_values[right] - values), left, right)
+    closest_residual = sorted_values[nearest] - values
+    closest = np.where(finite & (np.abs(closest_residual) <= tolerance), rows[nearest], -1)
+    
+    return {'closest': closest.reshape(shape), 'closest_residual': closest_residual.reshape(shape),
+            'query': query, 'rows': rows[position], 'residuals': sorted_values[position] - values[query]}
+
+def match_types(values, columns, table, k=1, scale=None, max_distance=np.inf, workers=1):
+    
+    """
+    
+    Finds the closest spectral types to stars with several known properties at once, e.g. columns = ['B-V','V-Ks','J-H','Mv'].
+    Each column is divided by 'scale' (by default the spread of that column in the table) and types are matched by euclidean distance
+    with a KD-tree, built once per combination of columns (see SpTTable.tree).
+    inf/nan entries in 'values' are treated as missing: each star is matched using only its finite columns, against only the types
+    that have all of those columns, and stars are grouped by their pattern of missing columns so each pattern is searched in one go.
+    
+    Returns a dictionary of arrays:
+    'best'       row of the closest type to each star, or -1 if none is within max_distance or the star has no finite columns,
+    'SpT'        the closest types ('' where best is -1),
+    'distance'   normalised distance to the closest type (inf where best is -1),
+    'ncolumns'   number of columns used for each star, distances are only comparable between stars with equal ncolumns,
+    and, if k > 1, 'rows' and 'distances' of shape (N,k) giving the k closest candidates in order (padded with -1 and inf).
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    values: (N,C) array of the properties of N stars, or a (C,) array for a single star.
+    
+    columns: List of the C column names 'values' correspond to.
+    
+    table: The SpTTable to be matched against, see load_table.
+    
+    k: Number of candidate types to return per star.
+    
+    scale: Optional (C,) array of the values each column is divided by, e.g. typical measurement errors.
+    
+    max_distance: Largest normalised distance at which a type counts as a match.
+    
+    workers: Number of threads used by the KD-tree queries, -1 uses all cpus.
+
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    columns = list(columns)
+    values = np.asarray(values, dtype=float)
+    single = values.ndim == 1
+    values = np.atleast_2d(values)
+    if values.shape[1] != len(columns):
+        raise ValueError('values must have one entry per column, got {} entries for {} columns'.format(values.shape[1], len(columns)))
+    scale = table.scales(columns) if scale is None else np.broadcast_to(np.asarray(scale, dtype=float), (len(columns),))
+    
+    N = len(values)
+    rows = np.full((N, k), -1)
+    distances = np.full((N, k), np.inf)
+    
+    #group stars by which columns they have
+    finite = np.isfinite(values)
+    patterns, group = np.unique(finite, axis=0, return_inverse=True)
+    group = group.ravel()
+    for g, pattern in enumerate(patterns):
+        if not pattern.any():
+            continue
+        stars = np.flatnonzero(group == g)
+        used = [column for column, have in zip(columns, pattern) if have]
+        tree, tree_rows = table.tree(used, scale[pattern])
+        if tree.n == 0:
+            continue
+        d, i = tree.query(values[np.ix_(stars, pattern)]/scale[pattern], k=k, distance_upper_bound=max_distance, workers=workers)
+        d, i = d.reshape(len(stars), k), i.reshape(len(stars), k)
+        found = i < tree.n # missing neighbours are flagged with index tree.n
+        rows[stars] = np.where(found, tree_rows[np.minimum(i, tree.n - 1)], -1)
+        distances[stars] = np.where(found, d, np.inf)
+    
+    best = rows[:, 0]
+    result = {'best': best, 'SpT': np.where(best >= 0, table.SpT[best], ''), 'distance': distances[:, 0], 'ncolumns': finite.sum(axis=1)}
+    if k > 1:
+        result['rows'] = rows
+        result['distances'] = distances
+    if single:
+        result = {key: value[0] for key, value in result.items()}
+    return result
+
+def interpolate_column(values, xcolumn, ycolumn, table, kind='pchip'):
+    
+    """
+    
+    Smoothly maps an array of values of one table column to another, e.g. interpolate_column(Mv, 'Mv', 'Teff', table) or
+    interpolate_column(VKs, 'V-Ks', 'R_Rsun', table), interpolating between spectral type rows. Values outside the valid range of
+    the mapping give nan, see SpTTable.interpolator for the range and the options for 'kind'.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    values: Array of values of xcolumn.
+    
+    xcolumn: The column 'values' correspond to.
+    
+    ycolumn: The column to be returned.
+    
+    table: The SpTTable to be interpolated, see load_table.
+    
+    kind: 'pchip' or 'linear'.
+
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    return table.interpolator(xcolumn, ycolumn, kind)['function'](np.asarray(values, dtype=float))
+
+def _type_rows(SpT, table):
+    # row of each spectral type, -1 where the type is missing ('' or None)
+    SpT = np.asarray(SpT)
+    if SpT.dtype == object:
+        SpT = np.where(SpT == None, '', SpT).astype(str)
+    types, inverse = np.unique(SpT.astype(str), return_inverse=True)
+    rows = np.array([table.index(SpT) if SpT else -1 for SpT in types.tolist()], dtype=int)
+    return rows[inverse.ravel()].reshape(SpT.shape)
+
+def stellar_distance_batch(table, SpT=None, distance=None, magnitude=None, thresh=0.1):
+    
+    """
+    
+    stellar_distance for whole catalogues: given two of spectral type, distance and apparent magnitude for each star will calculate the other.
+    Different stars may give different pairs, missing entries are None or '' in SpT and nan in distance and magnitude.
+    Where the type is missing the closest type in Mv is used, found with search_batch.
+    
+    Returns a dictionary of arrays, one entry per star:
+    'SpT' the given or closest type ('' if no type is within thresh), 'Mv' its absolute magnitude, 'distance' in parsecs and 'magnitude',
+    (nan for types with no tabulated Mv, e.g. the L and T types),
+    and for stars without a type all candidate types within thresh as flat arrays 'query' (the star), 'rows' and 'residuals' (in Mv), see search_batch.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    table: The SpTTable used to relate types and absolute magnitudes, see load_table.
+    
+    SpT: Array of spectral types, e.g. 'A0V', see stellar_distance.
+    
+    distance: Array of distances, as an astropy Quantity or in parsecs if unitless.
+    
+    magnitude: Array of apparent magnitudes.
+    
+    thresh: The factor to which you wish your spectral type matches to be accurate by, see stellar_distance.
+
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    if isinstance(distance, u.Quantity):
+        distance = distance.to(u.parsec).value
+    given = [np.asarray(x) for x in (SpT, distance, magnitude) if x is not None]
+    if not given:
+        raise ValueError('Please enter two of SpT, distance and magnitude for each star')
+    N = len(given[0])
+    
+    rows = _type_rows(SpT, table) if SpT is not None else np.full(N, -1)
+    distance = np.full(N, np.nan) if distance is None else np.asarray(distance, dtype=float)
+    magnitude = np.full(N, np.nan) if magnitude is None else np.asarray(magnitude, dtype=float)
+    if not len(rows) == len(distance) == len(magnitude) == N:
+        raise ValueError('SpT, distance and magnitude must have the same length')
+    
+    has_type = rows >= 0
+    has_distance = np.isfinite(distance)
+    has_magnitude = np.isfinite(magnitude)
+    bad = has_type.astype(int) + has_distance + has_magnitude != 2
+    if bad.any():
+        raise ValueError('Please enter two and only two of SpT, distance and magnitude, {} stars do not'.format(bad.sum()))
+    
+    Mv = np.where(has_type, table['Mv'][rows], np.nan)
+    Mv[~np.isfinite(Mv)] = np.nan #types with no tabulated Mv (stored as inf) give nan distances and magnitudes
+    distance = np.where(has_distance, distance, 10**((magnitude - Mv)/5 + 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.where(has_magnitude, magnitude, Mv + 5*(np.log10(distance) - 1))
+    
+    #types of stars with distance and magnitude
+    untyped = np.flatnonzero(~has_type)
+    matches = search_batch(magnitude[untyped] - 5*(np.log10(distance[untyped]) - 1), 'Mv', table, thresh)
+    rows[untyped] = matches['closest']
+    Mv[untyped] = np.where(matches['closest'] >= 0, table['Mv'][matches['closest']], np.nan)
+    
+    return {'SpT': np.where(rows >= 0, table.SpT[rows], ''), 'Mv': Mv, 'distance': distance, 'magnitude': magnitude,
+            'query': untyped[matches['query']], 'rows': matches['rows'], 'residuals': matches['residuals']}
+
+def stellar_distance_uncertainty(table, SpT, magnitude, magnitude_error=0, type_error=1, ndraws=1000, percentiles=(16,50,84), seed=None, max_bytes=2**27):
+    
+    """
+    
+    Propagates magnitude errors and spectral type uncertainty through the distances of stellar_distance_batch.
+    For each star 'ndraws' realisations are drawn: a Gaussian magnitude error and a type offset of round(Gaussian(0, type_error)) rows,
+    moving through the neighbouring types of the table that have an Mv (clipped at either end). All draws of a chunk of stars are evaluated
+    as one (stars, ndraws) array, the chunk chosen to keep temporaries within about 'max_bytes' bytes, so any number of stars can be processed.
+    Returns a dictionary with 'Percentiles' and 'distance', an (N, len(percentiles)) array of distance percentiles in parsecs.
+    
+    ---------------------------------------------------------------------------------------------------------
+    
+    Parameters:
+        
+    table: The SpTTable used to relate types and absolute magnitudes, see load_table.
+    
+    SpT: Array of spectral types, e.g. 'A0V'.
+    
+    magnitude: Array of apparent magnitudes.
+    
+    magnitude_error: Standard deviation of the magnitudes, a scalar or one per star.
+    
+    type_error: Standard deviation of the type in table rows, a scalar or one per star, e.g. 1 for roughly one subtype.
+    
+    ndraws: Number of realisations per star.
+    
+    percentiles: Percentiles of the distances returned.
+    
+    seed: Seed for numpy.random.default_rng, for reproducible draws.
+
+    --------------------------------------------------------------------------------------------------------
+    
+    """
+    
+    rows = _type_rows(SpT, table)
+    if np.any(rows < 0):
+        raise ValueError('Please enter a spectral type for every star')
+    magnitude = np.asarray(magnitude, dtype=float)
+    N = len(rows)
+    magnitude_error = np.broadcast_to(np.asarray(magnitude_error, dtype=float), (N,))
+    type_error = np.broadcast_to(np.asarray(type_error, dtype=float), (N,))
+    
+    #types with an Mv, in table order, and where each star's type sits among them
+    Mv = np.asarray(table['Mv'], dtype=float)
+    ordered = np.flatnonzero(np.isfinite(Mv))
+    Mv = Mv[ordered]
+    position = np.searchsorted(ordered, rows)
+    if np.any(ordered[np.minimum(position, len(ordered) - 1)] != rows):
+        raise ValueError('Every spectral type must have a tabulated Mv')
+    
+    rng = np.random.default_rng(seed)
+    distance = np.empty((N, len(percentiles)))
+    chunk = max(1, int(max_bytes//(8*ndraws*6))) #roughly 6 temporaries of (chunk, ndraws)
+    for start in range(0, N, chunk):
+        stop = min(start + chunk, N)
+        offset = np.rint(rng.standard_normal((stop - start, ndraws))*type_error[start:stop, None]).astype(np.intp)
+        drawn = np.clip(position[start:stop, None] + offset, 0, len(Mv) - 1)
+        mags = magnitude[start:stop, None] + rng.standard_normal((stop - start, ndraws))*magnitude_error[start:stop, None]
+        distance[start:stop] = np.percentile(10**((mags - Mv[drawn])/5 + 1), percentiles, axis=1).T
+    
+    return {'Percentiles': np.asarray(percentiles), 'distance': distance}
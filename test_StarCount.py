@@ -0,0 +1,28 @@
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+import StarCount as sc
+
+def _directions(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0, 360, n), np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+
+def test_icrs_to_galactic_matches_astropy():
+    ra, dec = _directions()
+    l, b = sc.icrs_to_galactic(ra, dec)
+    expected = SkyCoord(ra=ra*u.degree, dec=dec*u.degree, frame='icrs').galactic
+    separation = SkyCoord(l=l*u.degree, b=b*u.degree, frame='galactic').separation(expected)
+    assert np.max(separation.to(u.mas).value) < 1
+
+def test_galactic_to_icrs_matches_astropy():
+    l, b = _directions(seed=1)
+    ra, dec = sc.galactic_to_icrs(l, b)
+    expected = SkyCoord(l=l*u.degree, b=b*u.degree, frame='galactic').icrs
+    separation = SkyCoord(ra=ra*u.degree, dec=dec*u.degree, frame='icrs').separation(expected)
+    assert np.max(separation.to(u.mas).value) < 1
+
+def test_round_trip():
+    ra, dec = _directions(seed=2)
+    back = SkyCoord(ra=ra*u.degree, dec=dec*u.degree, frame='icrs')
+    separation = SkyCoord(*sc.galactic_to_icrs(*sc.icrs_to_galactic(ra, dec)), unit='deg', frame='icrs').separation(back)
+    assert np.max(separation.to(u.mas).value) < 1